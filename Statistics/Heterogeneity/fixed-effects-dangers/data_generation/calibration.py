@@ -0,0 +1,73 @@
+"""
+calibration.py
+
+Calibrates the DGP parameters for a family of target bias magnitudes.
+
+The DGP of the simulation solves the moment conditions in `moment_conditions.py`
+for TARGET_BIAS. Other magnitudes are reached by continuation from this
+solution (see `gmm_solver.continuation`), so that the DGPs of neighbouring
+targets are close to each other, and the solutions are cached in
+CALIBRATION_CACHE_DIR. Calibrating a sweep once in advance, e.g. with
+    python -m data_generation.calibration 250 500 2000 5000
+lets the simulations for these targets start immediately.
+
+Functions:
+    - calibrate_dgp_family(target_biases: Sequence[float],
+            cache_dir: Optional[str] = CALIBRATION_CACHE_DIR)
+            -> Dict[float, Dict[str, np.ndarray]]:
+        Calibrates the DGP parameters for every target bias magnitude.
+"""
+
+import argparse
+
+import numpy as np
+
+from typing import Dict, Optional, Sequence
+
+from data_generation.moment_conditions import (
+    constraints,
+    param_initial_guess,
+    process_mu_sigma_params,
+    target_moment_conditions,
+)
+from data_generation.parameters import CALIBRATION_CACHE_DIR, TARGET_BIAS
+from gmm_solver.continuation import ContinuationSolver
+
+def calibrate_dgp_family(
+    target_biases: Sequence[float],
+    cache_dir: Optional[str] = CALIBRATION_CACHE_DIR,
+) -> Dict[float, Dict[str, np.ndarray]]:
+    """
+    Calibrates the DGP parameters for every target bias magnitude.
+
+    Args:
+        target_biases (Sequence[float]): Target bias magnitudes.
+        cache_dir (Optional[str]): Folder of the solution cache, None to
+            disable caching.
+
+    Returns:
+        Dict[float, Dict[str, np.ndarray]]: Processed DGP parameters (mu and
+            sigma matrices, see `process_mu_sigma_params`) by target.
+    """
+    solver = ContinuationSolver(
+        target_moment_conditions,
+        param_initial_guess,
+        TARGET_BIAS,
+        constraints,
+        process_func=process_mu_sigma_params,
+        cache_dir=cache_dir,
+    )
+    return solver.process_solutions(target_biases)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calibrate and cache the DGPs of several target bias magnitudes."
+    )
+    parser.add_argument("target_biases", type=float, nargs="+")
+    parser.add_argument("--cache-dir", default=CALIBRATION_CACHE_DIR)
+    args = parser.parse_args()
+    family = calibrate_dgp_family(args.target_biases, args.cache_dir)
+    for target_bias, mu_sigma_params in family.items():
+        print(f"Target bias {target_bias:g}:")
+        for name, value in mu_sigma_params.items():
+            print(f"  {name}: {np.round(value, 4).tolist()}")
@@ -6,32 +6,45 @@ encode consistency of OLS and the inconsistency of FE estimators. The module
 additionally includes constraints on DGP parameters, an initial guess, and a function
 for processing parameters into a dictionary expected by generate_data.
 The components of this file correspond to the attributes of the GMMSolver class.
+The moment conditions and constraints are vectorized: they also evaluate a whole
+population of parameter vectors at once (see GMMSolver.minimize_population).
 
 Functions:
+- target_moment_conditions(params: np.ndarray, target_bias: float) -> np.ndarray:
+    Defines the moment equations for a given target bias magnitude.
 - sim_moment_conditions(params: np.ndarray) -> np.ndarray: 
-    Defines the moment equations evaluated at given parameters.
+    Defines the moment equations evaluated at given parameters (for TARGET_BIAS).
 - process_mu_sigma_params(params: np.ndarray) -> dict: 
     Extracts mu and sigma matrices from the parameter vector.
 
 Variables:
 - constraints (List[Dict[str, Any]]): constraints on the DGP parameters
 - param_initial_guess (List[float]): initial guess for parameters
+- param_bounds (List[Tuple[float, float]]): search ranges of the parameters for
+    population-based global optimizers
  
 """
 import numpy as np
 
+from data_generation.parameters import TARGET_BIAS
 
-def sim_moment_conditions(params: np.ndarray) -> np.ndarray:
+
+def target_moment_conditions(params: np.ndarray, target_bias: float) -> np.ndarray:
     """ 
-    Moment conditions for consistency of OLS and inconsistency of FE estimators.
+    Moment conditions for consistency of OLS and inconsistency of FE estimators,
+    for a given magnitude of the FE bias.
 
     Args:
-        params (np.ndarray): Parameter values.
+        params (np.ndarray): Parameter values, a vector or a (P × 10) population.
+        target_bias (float): Target difference of the second moments of the
+            differences of the covariates between the two effect groups.
 
     Returns:
         np.ndarray: Moment equations evaluated at given parameters.
     """
-    sigma1p, sigma2p, rhop, mu1p, mu2p, sigma1m, sigma2m, rhom, mu1m, mu2m = params
+    sigma1p, sigma2p, rhop, mu1p, mu2p, sigma1m, sigma2m, rhom, mu1m, mu2m = (
+        np.asarray(params).T
+    )
 
     return np.array([
         sigma2p**2 + mu2p**2 + mu2p - sigma2m**2 - mu2m**2 - mu2m,
@@ -40,8 +53,21 @@ def sim_moment_conditions(params: np.ndarray) -> np.ndarray:
         + mu2p**2 + mu1p**2 - 2 * mu1p * mu2p
         - sigma1m**2 - sigma2m**2 + 2 * rhom * sigma1m * sigma2m
         - mu2m**2 - mu1m**2 + 2 * mu1m * mu2m
-        - 1000
-    ])
+        - target_bias
+    ]).T
+
+def sim_moment_conditions(params: np.ndarray) -> np.ndarray:
+    """ 
+    Moment conditions for consistency of OLS and inconsistency of FE estimators.
+
+    Args:
+        params (np.ndarray): Parameter values, a vector or a (P × 10) population.
+
+    Returns:
+        np.ndarray: Moment equations evaluated at given parameters, (P × 3) for a 
+            population.
+    """
+    return target_moment_conditions(params, TARGET_BIAS)
 
 def process_mu_sigma_params(params: np.ndarray) -> dict:
     """
@@ -84,4 +110,10 @@ constraints = [
 ]
 
 # Initial guess for parameters
-param_initial_guess = [12, 15,  0.3, 24, -7, 2,  8,  0.6,  5, 14]
\ No newline at end of file
+param_initial_guess = [12, 15,  0.3, 24, -7, 2,  8,  0.6,  5, 14]
+
+# Search ranges of the parameters for population-based global optimizers
+param_bounds = [
+    (0, 50), (0, 50), (-1, 1), (-50, 50), (-50, 50),
+    (0, 50), (0, 50), (-1, 1), (-50, 50), (-50, 50),
+]
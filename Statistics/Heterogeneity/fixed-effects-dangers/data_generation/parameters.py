@@ -4,11 +4,32 @@ parameters.py
 This module contains the constants used for the simulation.
 
 Constants:
+- ANIMATION_DIR (str): Directory of the per-frame data slices and the cache of rendered 
+    frames of the KDE animation.
+- ANIMATION_FRAME_DURATION (float): Seconds per frame of the KDE animation.
 - BETA_MEAN (float): Mean value for the slope used in the simulation. 
+- CALIBRATION_CACHE_DIR (str): Directory of the cached DGP calibrations along paths of
+    target bias magnitudes.
+- DISTRIBUTED_BLOCK_SIZE (int): Number of replications per task in distributed mode.
+- DISTRIBUTED_LEASE_TIMEOUT (float): Seconds after which tasks of unresponsive workers
+    are re-queued in distributed mode.
+- EXECUTION_SPLIT_FILE (str): File with the processes x threads split measured by
+    `main.py --tune`.
 - N_REPLICATIONS (int): Number of replications for each seed.
 - N_VALUES (numpy.ndarray): Array of values representing different sample sizes for the simulation.
 - OUTPUT_DIR (str): Directory where the simulation results will be saved.
 - SEEDS (list of int): List of seeds for random number generation to ensure reproducibility.
+- SEED_SPACING (int): Smallest distance between two seeds. Replication r of a seed draws
+    its data with seed + r, so no seed may run more replications than this.
+- SEQUENTIAL_BLOCK_SIZE (int): Number of replications between stopping checks in sequential mode.
+- SEQUENTIAL_MAX_REPLICATIONS (int): Hard cap on replications per seed and cell in sequential mode,
+    at most SEED_SPACING.
+- SEQUENTIAL_SE_TOLERANCE (float): Target Monte Carlo standard error of the mean coefficient 
+    estimate per seed and cell in sequential mode.
+- TARGET_BIAS (float): Target magnitude of the FE bias in the moment conditions of the
+    DGP; other magnitudes are calibrated by continuation from it.
+- TUNING_REPLICATIONS (int): Number of replications per seed of the largest cell timed
+    for every split by `main.py --tune`.
 """
 
 import numpy as np
@@ -19,6 +40,33 @@ N_REPLICATIONS = 200
 N_VALUES = np.concatenate((np.arange(100, 1000, 50), [1000, 2000, 5000, 10000]))
 SEEDS = [1000, 2000, 3000, 40000, 5000, 6000, 7000, 8000]
 
+# DGP calibration parameters
+TARGET_BIAS = 1000.0
+CALIBRATION_CACHE_DIR = "simulation_results/calibration"
+
+# Sequential stopping parameters
+SEQUENTIAL_BLOCK_SIZE = 50
+SEQUENTIAL_MAX_REPLICATIONS = 1000
+SEQUENTIAL_SE_TOLERANCE = 0.0002
+
+# Replications of one seed must not reuse the data seeds of the next seed
+SEED_SPACING = int(np.diff(np.sort(SEEDS)).min())
+assert max(N_REPLICATIONS, SEQUENTIAL_MAX_REPLICATIONS) <= SEED_SPACING, (
+    "More replications per seed than the spacing of SEEDS: the samples of "
+    "different seeds would overlap"
+)
+
+# Distributed execution parameters
+DISTRIBUTED_BLOCK_SIZE = 25
+DISTRIBUTED_LEASE_TIMEOUT = 600.0
+
+# Execution parameters
+EXECUTION_SPLIT_FILE = "simulation_results/execution_split.json"
+TUNING_REPLICATIONS = 10
 
 # Output directory
-OUTPUT_DIR = "simulation_results"
\ No newline at end of file
+OUTPUT_DIR = "simulation_results"
+
+# Animation parameters
+ANIMATION_DIR = "simulation_results/animation"
+ANIMATION_FRAME_DURATION = 0.5
\ No newline at end of file
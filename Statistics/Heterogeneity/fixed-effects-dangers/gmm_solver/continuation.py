@@ -0,0 +1,411 @@
+"""
+continuation.py
+
+Calibrates a whole family of parameter vectors along a path of target values
+by numerical continuation (homotopy).
+
+The moment conditions of the family depend on a scalar target t, e.g. the
+bias magnitude in `data_generation.moment_conditions`. Solving every target
+from the same initial guess is slow, may fail for targets far from the
+guess, and may land on unrelated solutions for neighbouring targets. Here
+the start target is solved first and the family follows a fixed path of
+nodes away from it: the nodes are equally spaced in asinh(t / |start|), i.e.
+roughly geometric for targets far from zero. Every node is reached from the
+previous one, and every requested target from the nearest node between it
+and the start, so the solution of a target never depends on which other
+targets were solved before. A step has two stages:
+
+- a predictor step, the secant extrapolation of the solutions at the two
+  nodes before the step;
+- a corrector, Gauss-Newton iterations with minimum-norm steps, which stay
+  close to the predicted point when there are more parameters than moment
+  conditions. If they fail, e.g. because of the constraints, a GMMSolver is
+  warm-started from the predicted point instead.
+
+A step fails if the moment conditions are not satisfied up to a tolerance;
+failed steps are bisected (the midpoints are not kept). The solutions of the
+nodes and of the requested targets are cached in a JSON file, keyed by the
+source code of the moment function and the settings of the continuation,
+so that later sweeps over (a subset of) the same targets start immediately.
+
+Classes:
+    - ContinuationSolver: Solves GMM problems along a path of targets.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+
+import numpy as np
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from gmm_solver.solver import GMMSolver
+
+class ContinuationSolver:
+    """
+    Solves a family of GMM problems m(θ, t) = 0 along a path of targets t.
+
+    Attributes:
+        moment_family (Callable[[np.ndarray, float], np.ndarray]):
+            Function returning moment conditions given parameter values and
+            a target.
+        initial_guess (np.ndarray):
+            Initial parameter values for the solve at the start target.
+        start_target (float):
+            Target solved first, from the initial guess. All other targets
+            are reached by continuation from it.
+        constraints (List[Dict[str, Any]]):
+            Inequality constraints, as for GMMSolver. Predictor steps that
+            violate them are replaced by the previous solution.
+        path_step (float):
+            Distance of neighbouring nodes of the path in asinh(t / |start|).
+        weighting_matrix (Optional[np.ndarray]):
+            Weighting matrix of the GMM objective. Defaults to identity.
+        process_func (Optional[Callable[[np.ndarray], Dict[str, Any]]]):
+            Function that processes solutions into a meaningful format.
+        tolerance (float):
+            Maximal absolute value of the moment conditions at a solution.
+        max_bisections (int):
+            Maximal number of times a failed step is halved.
+        cache_file (Optional[Path]):
+            JSON file with the cached solutions, None to disable caching.
+    """
+
+    def __init__(
+        self,
+        moment_family: Callable[[np.ndarray, float], np.ndarray],
+        initial_guess: np.ndarray,
+        start_target: float,
+        constraints: Optional[List[Dict[str, Any]]] = None,
+        weighting_matrix: Optional[np.ndarray] = None,
+        process_func: Optional[Callable[[np.ndarray], Dict[str, Any]]] = None,
+        tolerance: float = 1e-3,
+        max_bisections: int = 8,
+        cache_dir: Optional[str] = None,
+        path_step: float = 0.25,
+    ) -> None:
+        """
+        Args:
+            moment_family (Callable[[np.ndarray, float], np.ndarray]):
+                Moment conditions given parameter values and a target.
+            initial_guess (np.ndarray):
+                Initial parameter values for the start target.
+            start_target (float):
+                Target solved first, from the initial guess.
+            constraints (Optional[List[Dict[str, Any]]], optional):
+                Inequality constraints. Defaults to None.
+            weighting_matrix (Optional[np.ndarray], optional):
+                Weighting matrix for GMM. Defaults to identity matrix.
+            process_func (Optional[Callable[[np.ndarray], Dict[str, Any]]], optional):
+                Function to format the solutions. Defaults to None.
+            tolerance (float): Maximal absolute value of the moment conditions
+                at a solution.
+            max_bisections (int): Maximal number of halvings of a failed step.
+            cache_dir (Optional[str], optional): Folder of the solution cache.
+                Defaults to None (no caching).
+            path_step (float): Distance of neighbouring nodes of the path in
+                asinh(t / |start|).
+        """
+        self.moment_family = moment_family
+        self.initial_guess = np.array(initial_guess, dtype=float)
+        self.start_target = float(start_target)
+        self.constraints = constraints if constraints else []
+        self.weighting_matrix = weighting_matrix
+        self.process_func = process_func
+        self.tolerance = tolerance
+        self.max_bisections = max_bisections
+        self.path_step = path_step
+        self._scale = abs(self.start_target) if self.start_target != 0 else 1.0
+        self.cache_file = (
+            None
+            if cache_dir is None
+            else Path(cache_dir) / f"continuation_{self._cache_key()[:16]}.json"
+        )
+        self.nodes: Dict[int, np.ndarray] = {}
+        self.solutions: Dict[float, np.ndarray] = {}
+        self._load_cache()
+
+    def _cache_key(self) -> str:
+        """
+        Hash of everything that determines the solutions: the source code of
+        the moment function and constraints, and the continuation settings.
+        """
+        sources = [inspect.getsource(self.moment_family)] + [
+            inspect.getsource(constraint["fun"]) for constraint in self.constraints
+        ]
+        settings = {
+            "initial_guess": self.initial_guess.tolist(),
+            "start_target": self.start_target,
+            "weighting_matrix": (
+                None
+                if self.weighting_matrix is None
+                else np.asarray(self.weighting_matrix).tolist()
+            ),
+            "tolerance": self.tolerance,
+            "max_bisections": self.max_bisections,
+            "path_step": self.path_step,
+        }
+        payload = "\n".join(sources) + json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _load_cache(self) -> None:
+        """Loads the cached node and target solutions, if any."""
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+        with open(self.cache_file) as file:
+            cached = json.load(file)
+        self.nodes = {
+            int(index): np.array(params) for index, params in cached["nodes"].items()
+        }
+        self.solutions = {
+            float(target): np.array(params)
+            for target, params in cached["solutions"].items()
+        }
+
+    def _save_cache(self) -> None:
+        """Writes the solutions atomically to the cache file."""
+        if self.cache_file is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.cache_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w") as file:
+            json.dump(
+                {
+                    "nodes": {
+                        str(index): params.tolist()
+                        for index, params in sorted(self.nodes.items())
+                    },
+                    "solutions": {
+                        repr(target): params.tolist()
+                        for target, params in sorted(self.solutions.items())
+                    },
+                },
+                file,
+                indent=1,
+            )
+        os.replace(tmp_file, self.cache_file)
+
+    def _node_target(self, index: int) -> float:
+        """Target of a node of the path; node 0 is the start target."""
+        if index == 0:
+            return self.start_target
+        return self._scale * float(np.sinh(
+            np.arcsinh(self.start_target / self._scale) + index * self.path_step
+        ))
+
+    def _last_node(self, target: float) -> int:
+        """Index of the last node between the start and a target."""
+        distance = (
+            np.arcsinh(target / self._scale)
+            - np.arcsinh(self.start_target / self._scale)
+        ) / self.path_step
+        # Tolerance, so that targets on a node are reached without a step
+        return int(np.sign(distance) * np.floor(abs(distance) + 1e-9))
+
+    def _anchors(self, index: int) -> List[Tuple[float, np.ndarray]]:
+        """Solutions of a node and its predecessor, which predict the next step."""
+        anchors = [(self._node_target(index), self.nodes[index])]
+        if index != 0:
+            previous = index - int(np.sign(index))
+            anchors.insert(0, (self._node_target(previous), self.nodes[previous]))
+        return anchors
+
+    def _solve_node(self, index: int) -> np.ndarray:
+        """
+        Solves the nodes from the start to a node, reusing solved nodes.
+
+        Raises:
+            ValueError: If the start target or a continuation step fails.
+        """
+        if 0 not in self.nodes:
+            solution = self._correct(self.start_target, self.initial_guess)
+            if solution is None:
+                raise ValueError(
+                    f"Optimization failed at the start target {self.start_target}"
+                )
+            self.nodes[0] = solution
+        direction = int(np.sign(index))
+        for node in range(direction, index + direction, direction or 1):
+            if node in self.nodes:
+                continue
+            previous = node - direction
+            solution = self._step(self._anchors(previous), self._node_target(node))
+            if solution is None:
+                raise ValueError(
+                    f"Continuation failed between targets "
+                    f"{self._node_target(previous)} and {self._node_target(node)}"
+                )
+            self.nodes[node] = solution
+        return self.nodes[index]
+
+    def _is_feasible(self, params: np.ndarray) -> bool:
+        """Whether params satisfy all inequality constraints."""
+        return all(
+            np.all(np.asarray(constraint["fun"](params)) >= 0)
+            for constraint in self.constraints
+        )
+
+    def _is_solution(self, params: np.ndarray, target: float) -> bool:
+        """Whether params satisfy the moment conditions of a target."""
+        residuals = self.moment_family(params, target)
+        return bool(np.max(np.abs(residuals)) <= self.tolerance)
+
+    def _newton_correct(
+        self,
+        target: float,
+        start: np.ndarray,
+        max_iterations: int = 20,
+    ) -> Optional[np.ndarray]:
+        """
+        Gauss-Newton iterations from a start, with (relative) minimum-norm
+        steps and Jacobians by central differences. Returns None if they do not
+        converge to a feasible solution.
+        """
+        params = start.copy()
+        steps = np.finfo(float).eps ** (1 / 3) * np.maximum(np.abs(params), 1)
+        for _ in range(max_iterations):
+            residuals = self.moment_family(params, target)
+            if np.max(np.abs(residuals)) <= 1e-3 * self.tolerance:
+                break
+            jacobian = np.column_stack([
+                (
+                    self.moment_family(params + shift, target)
+                    - self.moment_family(params - shift, target)
+                ) / (2 * step)
+                for shift, step in zip(np.diag(steps), steps)
+            ])
+            # Minimum-norm step in relative terms, so that parameters of
+            # different magnitudes move in proportion
+            scale = np.maximum(np.abs(params), 1)
+            params = params - scale * np.linalg.lstsq(
+                jacobian * scale, residuals, rcond=None
+            )[0]
+            if not np.all(np.isfinite(params)):
+                return None
+        if not (self._is_feasible(params) and self._is_solution(params, target)):
+            return None
+        return params
+
+    def _correct(self, target: float, start: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Solves the GMM problem of a target with a GMMSolver warm-started from
+        a start. Returns None if the optimizer fails or the moment conditions
+        are not satisfied.
+        """
+        solver = GMMSolver(
+            lambda params: self.moment_family(params, target),
+            start,
+            self.constraints,
+            self.weighting_matrix,
+        )
+        try:
+            solver.minimize()
+        except ValueError:
+            return None
+        if not self._is_solution(solver.estimated_params, target):
+            return None
+        return solver.estimated_params
+
+    def _step(
+        self,
+        anchors: List[Tuple[float, np.ndarray]],
+        target: float,
+        bisections: int = 0,
+    ) -> Optional[np.ndarray]:
+        """
+        Continues from the last of the anchors (one or two (target, solution)
+        pairs) to a new target: predicts by secant extrapolation, corrects by
+        Gauss-Newton iterations or with GMMSolver, and halves the step on
+        failure. Midpoints of halved steps only serve as anchors of the
+        remaining step.
+        """
+        current_target, current = anchors[-1]
+        if len(anchors) > 1:
+            previous_target, previous = anchors[-2]
+            slope = (current - previous) / (current_target - previous_target)
+            predicted = current + slope * (target - current_target)
+            if not self._is_feasible(predicted):
+                predicted = current
+        else:
+            predicted = current
+
+        solution = self._newton_correct(target, predicted)
+        if solution is None:
+            solution = self._correct(target, predicted)
+        if solution is None and predicted is not current:
+            solution = self._correct(target, current)
+        if solution is not None:
+            return solution
+        if bisections >= self.max_bisections:
+            return None
+
+        # Halve the step: reach the midpoint first, then the target
+        midpoint = 0.5 * (current_target + target)
+        midpoint_solution = self._step(anchors, midpoint, bisections + 1)
+        if midpoint_solution is None:
+            return None
+        return self._step(
+            [anchors[-1], (midpoint, midpoint_solution)], target, bisections + 1
+        )
+
+    def solve(self, targets: Sequence[float]) -> Dict[float, np.ndarray]:
+        """
+        Solves all targets by continuation from the start target.
+
+        Every target is reached from the last node of the path between the
+        start and the target, so its solution does not depend on the other
+        targets or on the order of the calls. Cached solutions are reused,
+        and new solutions are added to the cache.
+
+        Args:
+            targets (Sequence[float]): Targets to solve.
+
+        Returns:
+            Dict[float, np.ndarray]: Solution of every target.
+
+        Raises:
+            ValueError: If the start target or a continuation step fails.
+        """
+        targets = sorted({float(target) for target in targets})
+        try:
+            for target in targets:
+                if target in self.solutions:
+                    continue
+                index = self._last_node(target)
+                self._solve_node(index)
+                if np.isclose(target, self._node_target(index), rtol=1e-12, atol=0):
+                    solution = self.nodes[index]
+                else:
+                    solution = self._step(self._anchors(index), target)
+                if solution is None:
+                    raise ValueError(
+                        f"Continuation failed between targets "
+                        f"{self._node_target(index)} and {target}"
+                    )
+                self.solutions[target] = solution
+        finally:
+            self._save_cache()
+        return {target: self.solutions[target] for target in targets}
+
+    def process_solutions(self, targets: Sequence[float]) -> Dict[float, Dict[str, Any]]:
+        """
+        Solves all targets and processes the solutions.
+
+        Args:
+            targets (Sequence[float]): Targets to solve.
+
+        Returns:
+            Dict[float, Dict[str, Any]]: Processed output of every target,
+                depends on user-supplied processing function.
+        """
+        solutions = self.solve(targets)
+        if self.process_func is None:
+            return {
+                target: {"parameters": params} for target, params in solutions.items()
+            }
+        return {
+            target: self.process_func(params) for target, params in solutions.items()
+        }
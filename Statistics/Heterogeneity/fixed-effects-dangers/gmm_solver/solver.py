@@ -3,14 +3,23 @@ solver.py
 
 Implements a simple generic Generalized Method of Moments (GMM) class.
 
+Besides a local minimizer started from an initial guess, the solver has a
+population-based global minimizer (differential evolution). Its objective
+scores a whole population of parameter vectors at once: vectorized moment
+conditions map a (P × k) population to (P × q) moments, and the weighted
+quadratic forms of all individuals are a single einsum. Constraints enter
+the population objective as quadratic penalties, and expensive moment
+functions can be evaluated in parallel on a process pool.
+
 Classes:
     - GMMSolver: Estimates parameters by minimizing squared moment conditions. 
 """
 
 import numpy as np
 
-from scipy.optimize import minimize
-from typing import Callable, List, Dict, Any, Optional
+from concurrent.futures import Executor
+from scipy.optimize import differential_evolution, minimize
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
 
 class GMMSolver:
     """
@@ -28,6 +37,14 @@ class GMMSolver:
             Weighting matrix for the GMM objective function. Defaults to identity.
         process_func (Callable[[np.ndarray], Dict[str, Any]]):
             Function that processes the optimized parameters into a meaningful format.
+        vectorized (bool):
+            Whether moment_conditions maps a (P × k) population to (P × q)
+            moments. Constraint functions then receive the (k × P) transposed
+            population, so that `vars[i]` is the i-th parameter of every
+            individual.
+        penalty_weight (float):
+            Weight of the squared constraint violations in the population
+            objective.
     """
 
     def __init__(
@@ -36,7 +53,9 @@ class GMMSolver:
         initial_guess: np.ndarray,
         constraints: Optional[List[Dict[str, Any]]] = None,
         weighting_matrix: Optional[np.ndarray] = None,
-        process_func: Optional[Callable[[np.ndarray], Dict[str, Any]]] = None
+        process_func: Optional[Callable[[np.ndarray], Dict[str, Any]]] = None,
+        vectorized: bool = False,
+        penalty_weight: float = 1e6,
     ) -> None:
         """
         Initializes the GMM solver with the moment conditions and optimization settings.
@@ -52,16 +71,100 @@ class GMMSolver:
                 Weighting matrix for GMM. Defaults to identity matrix.
             process_func (Optional[Callable[[np.ndarray], Dict[str, Any]]], optional):
                 Function to format the final parameter estimates. Defaults to None.
+            vectorized (bool, optional):
+                Whether moment_conditions (and the constraints) evaluate a whole
+                population at once. Defaults to False.
+            penalty_weight (float, optional):
+                Weight of the squared constraint violations in the population
+                objective. Defaults to 1e6.
         """
         self.moment_conditions = moment_conditions
         self.initial_guess = np.array(initial_guess)
         self.constraints = constraints if constraints else []
+        self.vectorized = vectorized
+        self.penalty_weight = penalty_weight
         self.weighting_matrix = (
-            np.eye(len(moment_conditions(initial_guess))) if weighting_matrix is None else weighting_matrix
+            np.eye(len(self._moments(self.initial_guess))) if weighting_matrix is None else weighting_matrix
         )
         self.process_func = process_func
         self.estimated_params = None
 
+    def _moments(self, params: np.ndarray) -> np.ndarray:
+        """Moment conditions of a single parameter vector."""
+        if self.vectorized:
+            return self.moment_conditions(np.atleast_2d(params))[0]
+        return self.moment_conditions(params)
+
+    def _chunk_moments(self, population: np.ndarray) -> np.ndarray:
+        """Moment conditions of a population, (P × q)."""
+        if self.vectorized:
+            return self.moment_conditions(population)
+        return np.array([self.moment_conditions(params) for params in population])
+
+    def _population_moments(
+        self,
+        population: np.ndarray,
+        executor: Optional[Executor] = None,
+        num_chunks: int = 1,
+    ) -> np.ndarray:
+        """
+        Moment conditions of a population, optionally evaluated in chunks on an
+        executor. The moment function must then be picklable.
+        """
+        if executor is None or num_chunks <= 1:
+            return self._chunk_moments(population)
+        chunks = np.array_split(population, min(num_chunks, len(population)))
+        if self.vectorized:
+            moments = executor.map(self.moment_conditions, chunks)
+        else:
+            moments = executor.map(_row_moments, [self.moment_conditions] * len(chunks), chunks)
+        return np.concatenate(list(moments))
+
+    def _constraint_penalties(self, population: np.ndarray) -> np.ndarray:
+        """
+        Sum of squared constraint violations of every individual, (P,).
+        """
+        penalties = np.zeros(len(population))
+        for constraint in self.constraints:
+            if self.vectorized:
+                values = np.asarray(constraint["fun"](population.T), dtype=float)
+                values = values.reshape(-1, len(population)).T
+            else:
+                values = np.array(
+                    [np.atleast_1d(constraint["fun"](params)) for params in population],
+                    dtype=float,
+                )
+            if constraint["type"] == "ineq":
+                values = np.minimum(values, 0)
+            penalties += (values**2).sum(axis=1)
+        return penalties
+
+    def _population_objective(
+        self,
+        population: np.ndarray,
+        executor: Optional[Executor] = None,
+        num_chunks: int = 1,
+    ) -> np.ndarray:
+        """
+        Computes the penalized GMM objective of a whole population at once:
+        m(θ_p)ᵀ W m(θ_p) + penalty_weight × (squared constraint violations).
+
+        Args:
+            population (np.ndarray): Parameter vectors, (P × k).
+            executor (Optional[Executor], optional): Pool for the moments.
+            num_chunks (int): Number of chunks evaluated on the executor.
+
+        Returns:
+            np.ndarray: Objective value of every individual, (P,).
+        """
+        moments = self._population_moments(population, executor, num_chunks)
+        objective = np.einsum("pi,ij,pj->p", moments, self.weighting_matrix, moments)
+        if self.constraints:
+            objective = objective + self.penalty_weight * self._constraint_penalties(
+                population
+            )
+        return objective
+
     def _gmm_objective(self, params: np.ndarray) -> float:
         """
         Computes the GMM objective function: 
@@ -73,7 +176,7 @@ class GMMSolver:
         Returns:
             float: The GMM loss function value.
         """
-        moments = self.moment_conditions(params) 
+        moments = self._moments(params) 
         return moments.T @ self.weighting_matrix @ moments
 
     def minimize(self) -> None:
@@ -90,6 +193,66 @@ class GMMSolver:
 
         self.estimated_params = result.x
 
+    def minimize_population(
+        self,
+        bounds: Sequence[Tuple[float, float]],
+        population_size: int = 15,
+        max_generations: int = 1000,
+        tol: float = 1e-8,
+        seed: Optional[int] = None,
+        polish: bool = True,
+        executor: Optional[Executor] = None,
+        num_chunks: Optional[int] = None,
+    ) -> None:
+        """
+        Runs the GMM estimation with differential evolution, a derivative-free
+        global minimizer that needs no initial guess. Every generation is scored
+        with one call of the population objective, and the best individual is
+        polished with the local minimizer (with the exact constraints).
+
+        Args:
+            bounds (Sequence[Tuple[float, float]]): Search range of every parameter.
+            population_size (int): Individuals per parameter.
+            max_generations (int): Maximal number of generations.
+            tol (float): Relative tolerance of the spread of the population
+                objective at convergence.
+            seed (Optional[int], optional): Seed of the evolution.
+            polish (bool): Whether to polish the best individual locally.
+            executor (Optional[Executor], optional): Process pool on which the
+                moments of a generation are evaluated in chunks, for expensive
+                moment functions. Defaults to None (in-process).
+            num_chunks (Optional[int], optional): Number of chunks per generation.
+                Defaults to the number of workers of the executor.
+
+        Raises:
+            ValueError: If the best parameters violate the constraints.
+        """
+        if num_chunks is None:
+            num_chunks = getattr(executor, "_max_workers", 1) if executor else 1
+        result = differential_evolution(
+            lambda population: self._population_objective(
+                population.T, executor, num_chunks
+            ),
+            bounds,
+            popsize=population_size,
+            maxiter=max_generations,
+            tol=tol,
+            seed=seed,
+            polish=False,
+            updating="deferred",
+            vectorized=True,
+        )
+        best = result.x
+        if polish:
+            polished = minimize(self._gmm_objective, best, constraints=self.constraints)
+            if polished.success and polished.fun <= self._gmm_objective(best):
+                best = polished.x
+
+        if self._constraint_penalties(best[None, :])[0] > 0:
+            raise ValueError(f"Optimization failed: constraints violated at {best}")
+
+        self.estimated_params = best
+
     def process_solution(self) -> Dict[str, Any]:
         """
         Processes the estimated parameters into a meaningful format.
@@ -99,4 +262,11 @@ class GMMSolver:
         """
         if self.process_func is None:
             return {"parameters": self.estimated_params}
-        return self.process_func(self.estimated_params)
\ No newline at end of file
+        return self.process_func(self.estimated_params)
+
+def _row_moments(
+    moment_conditions: Callable[[np.ndarray], np.ndarray],
+    population: np.ndarray,
+) -> np.ndarray:
+    """Moment conditions of a population, one parameter vector at a time."""
+    return np.array([moment_conditions(params) for params in population])
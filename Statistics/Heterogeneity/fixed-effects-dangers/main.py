@@ -10,73 +10,253 @@ Author: Vladislav Morozov
 
 Steps:
 1. Load parameters and set up simulation configurations.
-2. Run Monte Carlo simulations in parallel for multiple sample sizes.
+2. Run Monte Carlo simulations in parallel for multiple sample sizes, with
+   live progress, throughput and ETA printed to stderr.
 3. Save and combine simulation results into a single output file.
 
 Outputs:
 - `simulation_results/combined_results.csv`: Aggregated simulation results.
+- `simulation_results/target_bias_<value>/combined_results.csv`: Results for a
+  target bias magnitude other than TARGET_BIAS (see --target-bias).
 
 Usage:
 Run the script using:
     python main.py
+To stop each cell once its Monte Carlo standard error is small enough, run:
+    python main.py --sequential
+To run the simulations through a task queue on a shared filesystem, with
+workers on several machines (each started with `python -m utils.task_queue DIR`
+from this folder), run:
+    python main.py --queue-dir DIR [--local-workers N]
+To simulate a DGP with a different magnitude of the FE bias, calibrated by
+continuation from TARGET_BIAS and cached (see `data_generation.calibration`), run:
+    python main.py --target-bias VALUE
+By default, one worker process runs per seed (at most one per core), and the
+BLAS/OpenMP/numba thread pools of every worker are pinned to its share of the
+cores to avoid oversubscription. The split can be set with
+    python main.py --processes P --threads T
+or measured on a short sample of the heaviest cell (and saved for later runs) with
+    python main.py --tune
+To submit to a warm worker pool that stays alive between runs, start
+    python -m utils.worker_pool
+once and add --pool.
+
+Heavy libraries are imported after parsing the arguments, so --help returns
+immediately.
 """
 
+import argparse
 import os
-import numpy as np
-import pandas as pd
-from concurrent.futures import ProcessPoolExecutor
-from pathlib import Path
-
-from data_generation.moment_conditions import (
-    constraints,
-    param_initial_guess,
-    process_mu_sigma_params, 
-    sim_moment_conditions, 
-)
+
+from typing import Tuple
+
 from data_generation.parameters import (
     BETA_MEAN,  
+    DISTRIBUTED_BLOCK_SIZE,
+    EXECUTION_SPLIT_FILE,
+    DISTRIBUTED_LEASE_TIMEOUT,
     OUTPUT_DIR,
     N_REPLICATIONS, 
     N_VALUES, 
     SEEDS, 
+    SEQUENTIAL_BLOCK_SIZE,
+    SEQUENTIAL_MAX_REPLICATIONS,
+    SEQUENTIAL_SE_TOLERANCE,
+    TARGET_BIAS,
+    TUNING_REPLICATIONS,
 )
-from gmm_solver.solver import GMMSolver
-from simulation.run_simulation import run_simulation_for_seed
-from utils.combine_results import combine_results
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+def parse_args() -> argparse.Namespace:
+    """Parses command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Pooled OLS vs. FE estimators under slope heterogeneity."
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help=(
+            "run replications in blocks and stop each cell once the standard "
+            "error of the mean coefficient estimate is below "
+            "SEQUENTIAL_SE_TOLERANCE (at most SEQUENTIAL_MAX_REPLICATIONS)"
+        ),
+    )
+    parser.add_argument(
+        "--pool",
+        action="store_true",
+        help=(
+            "submit to the warm worker pool started with "
+            "`python -m utils.worker_pool` instead of starting new workers"
+        ),
+    )
+    parser.add_argument(
+        "--queue-dir",
+        default=None,
+        help=(
+            "run through a task queue in this folder, on a filesystem shared "
+            "by all worker nodes (started with `python -m utils.task_queue`)"
+        ),
+    )
+    parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=0,
+        help="number of queue workers to start on this machine",
+    )
+    parser.add_argument(
+        "--target-bias",
+        type=float,
+        default=TARGET_BIAS,
+        help=(
+            "target magnitude of the FE bias in the moment conditions of the "
+            "DGP; results of values other than TARGET_BIAS are saved in "
+            "OUTPUT_DIR/target_bias_<value>"
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per seed, at most one per core)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help=(
+            "BLAS/OpenMP/numba threads per worker process (default: the "
+            "remaining cores divided among the processes)"
+        ),
+    )
+    parser.add_argument(
+        "--tune",
+        action="store_true",
+        help=(
+            "measure the fastest processes x threads split on a sample of the "
+            "largest n_units cell, save it to EXECUTION_SPLIT_FILE for later "
+            "runs, and exit"
+        ),
+    )
+    args = parser.parse_args()
+    if args.queue_dir is not None and (args.sequential or args.pool):
+        parser.error("--queue-dir does not support --sequential/--pool")
+    if args.pool and (args.processes or args.threads or args.tune):
+        parser.error(
+            "--pool uses the split of the pool daemon (see its --workers/--threads)"
+        )
+    return args
+
+def execution_split(args: argparse.Namespace) -> Tuple[int, int]:
+    """
+    Number of worker processes and threads per process: as given on the
+    command line, else as tuned with --tune on this machine, else planned
+    from the number of seeds and cores.
+    """
+    from utils.execution import load_split, plan_split
+
+    if args.processes is None and args.threads is None:
+        tuned = load_split(EXECUTION_SPLIT_FILE)
+        if tuned is not None:
+            return tuned[0], tuned[1]
+    return plan_split(args.processes, args.threads, len(SEEDS))
 
 def main() -> None:
     """Main function to run simulations in parallel and combine results."""
+    args = parse_args()
+
+    from data_generation.calibration import calibrate_dgp_family
+    from simulation.distributed import run_distributed_simulation
+    from simulation.run_simulation import run_simulation_for_seed
+    from simulation.run_simulation import run_simulation_for_cells
+    from utils.combine_results import combine_results
+    from utils.execution import save_split, tune_split
+    from utils.progress import ProgressTracker
+    from utils.worker_pool import WarmPoolClient, create_executor
+
+    # Ensure output directory exists
+    if args.target_bias == TARGET_BIAS:
+        output_dir = OUTPUT_DIR
+    else:
+        output_dir = os.path.join(OUTPUT_DIR, f"target_bias_{args.target_bias:g}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    if args.sequential:
+        n_replications = SEQUENTIAL_MAX_REPLICATIONS
+        se_tolerance = SEQUENTIAL_SE_TOLERANCE
+    else:
+        n_replications = N_REPLICATIONS
+        se_tolerance = None
     
-    # Compute simulation parameters using GMM solver
-    solver_dgp_params = GMMSolver(
-        sim_moment_conditions,
-        param_initial_guess,
-        constraints, 
-        process_func=process_mu_sigma_params,
-    )
-    solver_dgp_params.minimize()
-    mu_sigma_params = solver_dgp_params.process_solution()
+    # Compute simulation parameters using GMM solver, by continuation from
+    # TARGET_BIAS for other target bias magnitudes (cached)
+    mu_sigma_params = calibrate_dgp_family([args.target_bias])[args.target_bias]
+
+    if args.tune:
+        # One short task per seed in the largest cell, where BLAS and numba
+        # threads matter the most, after a warm-up replication of the
+        # smallest cell in every worker (imports and numba compilation)
+        best_split, _ = tune_split(
+            run_simulation_for_cells,
+            [
+                (seed, TUNING_REPLICATIONS, [max(N_VALUES)], BETA_MEAN, mu_sigma_params)
+                for seed in SEEDS
+            ],
+            warmup_task=(SEEDS[0], 1, [min(N_VALUES)], BETA_MEAN, mu_sigma_params),
+        )
+        save_split(EXECUTION_SPLIT_FILE, best_split)
+        print(
+            f"Fastest split: {best_split[0]} processes x {best_split[1]} threads, "
+            f"saved to {EXECUTION_SPLIT_FILE}"
+        )
+        return
+
+    if args.queue_dir is not None:
+        total = len(SEEDS) * len(N_VALUES) * n_replications
+        with ProgressTracker(total) as progress:
+            run_distributed_simulation(
+                SEEDS,
+                n_replications,
+                N_VALUES,
+                BETA_MEAN,
+                mu_sigma_params,
+                output_dir,
+                args.queue_dir,
+                DISTRIBUTED_BLOCK_SIZE,
+                DISTRIBUTED_LEASE_TIMEOUT,
+                args.local_workers,
+                progress.reporter("queue"),
+            )
+        combine_results(output_dir, SEEDS)
+        print("All results combined and saved to combined_results.csv")
+        return
 
-    # Run simulations in parallel
-    with ProcessPoolExecutor() as executor:
-        futures = [
+    # Run simulations in parallel. The pool client must exist before the
+    # progress tracker, see WarmPoolClient
+    if args.pool:
+        executor = WarmPoolClient()
+    else:
+        n_processes, n_threads = execution_split(args)
+        executor = create_executor(n_processes, threads_per_worker=n_threads)
+    total = len(SEEDS) * len(N_VALUES) * n_replications
+    with executor, ProgressTracker(total) as progress:
+        futures = {
             executor.submit(
                 run_simulation_for_seed, 
                 seed, 
-                N_REPLICATIONS,
+                n_replications,
                 N_VALUES, 
                 BETA_MEAN, 
                 mu_sigma_params,
-                OUTPUT_DIR,
-            )
+                output_dir,
+                progress.reporter(seed),
+                se_tolerance,
+                SEQUENTIAL_BLOCK_SIZE,
+            ): seed
             for seed in SEEDS
-        ]
+        }
+        progress.wait(futures)
 
     # Combine results
-    combine_results(OUTPUT_DIR, SEEDS)
+    combine_results(output_dir, SEEDS)
     print("All results combined and saved to combined_results.csv")
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+"""
+distributed.py
+
+Runs the simulations through the file-based task queue of `utils.task_queue`,
+so that workers on several machines sharing a filesystem can contribute.
+
+The simulations are split into tasks of (seed, `n_units`, block of
+replications), which keeps the expensive large-`n_units` cells spread over
+many workers. Task ids include a hash of the task arguments and code (see
+`utils.task_queue.make_task_id`), so rerunning the coordinator on the same
+queue folder only publishes the tasks without a committed result, and runs with
+other settings (e.g. another DGP or `--target-bias`) never reuse stale results. Once
+all tasks are done, the results are assembled into the usual
+`results_seed_{seed}.csv` files.
+
+Functions:
+    - run_distributed_simulation(seeds: list[int], 
+                                 n_replications: int, 
+                                 n_values: list[int], 
+                                 beta_mean: float, 
+                                 mu_sigma_params: Dict[str, np.ndarray], 
+                                 output_dir: str,
+                                 queue_dir: str,
+                                 block_size: int,
+                                 lease_timeout: float,
+                                 n_local_workers: int = 0,
+                                 progress: Optional[ProgressReporter] = None):
+        Publishes the simulations, waits for the workers and saves the results
+"""
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from typing import Dict, Optional
+
+from simulation.run_simulation import run_simulation_for_cells
+from utils.progress import ProgressReporter
+from utils.task_queue import FileTaskQueue, make_task_id, start_local_workers
+
+def run_distributed_simulation(seeds: list[int], 
+                               n_replications: int, 
+                               n_values: list[int], 
+                               beta_mean: float, 
+                               mu_sigma_params: Dict[str, np.ndarray], 
+                               output_dir: str,
+                               queue_dir: str,
+                               block_size: int,
+                               lease_timeout: float,
+                               n_local_workers: int = 0,
+                               progress: Optional[ProgressReporter] = None):
+    """
+    Runs the simulations through a task queue and saves results to CSV files.
+
+    Parameters:
+    - seeds (list[int]): Random seeds.
+    - n_replications (int): Number of replications per seed.
+    - n_values (list[int]): Different values of `n_units` to simulate.
+    - beta_mean (float): Average coefficient value for generating data.
+    - mu_sigma_params (Dict[str, np.ndarray]): DGP parameters, see
+        `run_simulation_for_cells`.
+    - output_dir (str): Directory to save the CSV files.
+    - queue_dir (str): Root folder of the queue, on a filesystem shared by all
+        nodes.
+    - block_size (int): Number of replications per task.
+    - lease_timeout (float): Seconds after which tasks of unresponsive workers
+        are re-queued. Must match the workers.
+    - n_local_workers (int): Number of worker processes to start on this
+        machine in addition to workers on other nodes. Defaults to 0.
+    - progress (ProgressReporter, optional): Reporter advanced as tasks finish.
+    """
+    queue = FileTaskQueue(queue_dir, lease_timeout)
+    queue.reopen()
+
+    # Publish tasks of (seed, n_units, block of replications)
+    task_sizes = {}
+    for seed in seeds:
+        for n_units in n_values:
+            for first_rep in range(0, n_replications, block_size):
+                n_block = min(block_size, n_replications - first_rep)
+                task_args = (seed, n_block, [n_units], beta_mean, mu_sigma_params)
+                task_kwargs = {"first_replication": first_rep}
+                task_id = make_task_id(f"seed{seed}_units{n_units:06d}_rep{first_rep:06d}",
+                                       run_simulation_for_cells,
+                                       *task_args,
+                                       **task_kwargs)
+                task_sizes[task_id] = n_block
+                queue.publish(task_id, run_simulation_for_cells, *task_args, **task_kwargs)
+    queue.close()
+
+    workers = start_local_workers(queue_dir, n_local_workers, lease_timeout)
+    results = queue.wait(task_sizes, progress)
+    for worker in workers:
+        worker.join()
+
+    # Assemble results in the order of run_simulation_for_seed
+    n_index = {n_units: index for index, n_units in enumerate(n_values)}
+    for seed in seeds:
+        seed_results = [
+            row
+            for task_id, task_results in results.items()
+            if task_id.startswith(f"seed{seed}_")
+            for row in task_results
+        ]
+        seed_results.sort(key=lambda row: (n_index[row["n_units"]], row["replication"]))
+        output_file = Path(output_dir) / f"results_seed_{seed}.csv"
+        pd.DataFrame(seed_results).to_csv(output_file, index=False)
+        print(f"Results saved to {output_file}")
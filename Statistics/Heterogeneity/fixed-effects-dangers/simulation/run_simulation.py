@@ -2,40 +2,84 @@
 run_simulation.py
 
 This module contains functions to run Monte Carlo simulations for different 
-seeds and save the results to CSV files. 
+seeds and save the results to CSV files. pyfixest is imported when the first
+simulation runs, so that importing the module stays fast.
 
 Functions:
+    - max_coef_mean_se(cell_results: list[dict]) -> float:
+        Largest Monte Carlo standard error of the mean coefficient estimate
+        across models in a cell
+    - run_simulation_for_cells(seed: int, 
+                            n_replications: int, 
+                            n_values: list[int], 
+                            beta_mean: float, 
+                            mu_sigma_params: Dict[str, np.ndarray], 
+                            progress: Optional[ProgressReporter] = None,
+                            se_tolerance: Optional[float] = None,
+                            block_size: int = 50,
+                            first_replication: int = 0) -> list[dict]:
+        Runs Monte Carlo for a given seed and list of `n_units` values
     - run_simulation_for_seed(seed: int, 
                             n_replications: int, 
                             n_values: list[int], 
                             beta_mean: float, 
                             mu_sigma_params: Dict[str, np.ndarray], 
-                            output_dir: str):
+                            output_dir: str,
+                            progress: Optional[ProgressReporter] = None,
+                            se_tolerance: Optional[float] = None,
+                            block_size: int = 50):
         Runs Monte Carlo for a given seed and saves the results
 """
 
 
 import numpy as np
 import pandas as pd
-import pyfixest as pf
 
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
  
 from data_generation.generate_data import generate_data
+from utils.progress import ProgressReporter
 
-def run_simulation_for_seed(seed: int, 
-                            n_replications: int, 
-                            n_values: list[int], 
-                            beta_mean: float, 
-                            mu_sigma_params: Dict[str, np.ndarray], 
-                            output_dir: str):
+def max_coef_mean_se(cell_results: list[dict]) -> float:
     """
-    Runs Monte Carlo simulations for a specific seed and saves results to a CSV file.
+    Largest Monte Carlo standard error of the mean of `coef_est` across models.
+
+    Args:
+        cell_results (list[dict]): Results of a single cell (one `n_units`).
+
+    Returns:
+        float: Largest standard error; infinite if a model has fewer than two
+            estimates.
+    """
+    coefs = pd.DataFrame(cell_results, columns=["model", "coef_est"])
+    stats = coefs.groupby("model")["coef_est"].agg(["std", "count"])
+    if stats.empty or (stats["count"] < 2).any():
+        return np.inf
+    return float((stats["std"] / np.sqrt(stats["count"])).max())
+
+def run_simulation_for_cells(seed: int, 
+                             n_replications: int, 
+                             n_values: list[int], 
+                             beta_mean: float, 
+                             mu_sigma_params: Dict[str, np.ndarray], 
+                             progress: Optional[ProgressReporter] = None,
+                             se_tolerance: Optional[float] = None,
+                             block_size: int = 50,
+                             first_replication: int = 0) -> list[dict]:
+    """
+    Runs Monte Carlo simulations for a specific seed and set of `n_units` values.
+
+    If `se_tolerance` is given, replications run in blocks of `block_size` and
+    each `n_units` cell stops once the Monte Carlo standard error of the mean
+    coefficient estimate of every model is below `se_tolerance`, or once
+    `n_replications` (the hard cap) is reached. The number of replications used
+    is then recorded in the `n_replications` column.
 
     Parameters:
     - seed (int): Random seed for reproducibility.
-    - n_replications (int): Number of replications per seed.
+    - n_replications (int): Number of replications per seed (maximal number in
+        sequential mode).
     - n_values (list[int]): Different values of `n_units` to simulate.
     - beta_mean (float): Average coefficient value for generating data.
     - mu_sigma_params (Dict[str, np.ndarray]): Dictionary containing:
@@ -43,12 +87,28 @@ def run_simulation_for_seed(seed: int,
             - "mu_minus" (np.ndarray): Mean for covariates when effect is -1.
             - "sigma_plus" (np.ndarray): Covariance for X when effect is +1.
             - "sigma_minus" (np.ndarray): Covariance for X when effect is -1.
-    - output_dir (str): Directory to save the CSV file.
+    - progress (ProgressReporter, optional): Reporter for live progress tracking.
+    - se_tolerance (float, optional): Target standard error for sequential
+        stopping. Defaults to None (fixed number of replications).
+    - block_size (int): Number of replications between stopping checks.
+    - first_replication (int): Index of the first replication, so that blocks
+        of replications can run as separate tasks. Defaults to 0.
+
+    Returns:
+    - list[dict]: One record per model, cell and replication.
     """
+    import pyfixest as pf
+
+    if progress is None:
+        progress = ProgressReporter(None, seed)
+
     results = []
     
     for n_units in n_values:
-        for replication in range(n_replications):
+        progress.start_cell(f"n_units={n_units}")
+        cell_results = []
+        last_replication = first_replication + n_replications
+        for replication in range(first_replication, last_replication):
             # Generate data
             data = generate_data(n_units, 
                                  beta_mean, 
@@ -62,7 +122,7 @@ def run_simulation_for_seed(seed: int,
                 fit_effect = pf.feols("outcome ~ covariate|Unit", data=data)
                 
                 # Collect results
-                results.append({
+                cell_results.append({
                     "seed": seed,
                     "replication": replication,
                     "n_units": n_units,
@@ -70,7 +130,7 @@ def run_simulation_for_seed(seed: int,
                     "coef_est": fit_no_effect.coef().iloc[0],
                     "ci_lower": fit_no_effect.confint().iloc[0, 0]
                 })
-                results.append({
+                cell_results.append({
                     "seed": seed,
                     "replication": replication,
                     "n_units": n_units,
@@ -80,6 +140,62 @@ def run_simulation_for_seed(seed: int,
                 })
             except Exception as e:
                 print(f"Error during fit (seed={seed}, n_units={n_units}, replication={replication}): {e}")
+            progress.advance()
+
+            # Sequential stopping: check precision after every block
+            if (
+                se_tolerance is not None
+                and (replication - first_replication + 1) % block_size == 0
+                and max_coef_mean_se(cell_results) <= se_tolerance
+            ):
+                break
+
+        if se_tolerance is not None:
+            n_used = replication - first_replication + 1
+            for row in cell_results:
+                row["n_replications"] = n_used
+            progress.skip(n_replications - n_used)
+        results.extend(cell_results)
+        progress.finish_cell()
+    return results
+
+def run_simulation_for_seed(seed: int, 
+                            n_replications: int, 
+                            n_values: list[int], 
+                            beta_mean: float, 
+                            mu_sigma_params: Dict[str, np.ndarray], 
+                            output_dir: str,
+                            progress: Optional[ProgressReporter] = None,
+                            se_tolerance: Optional[float] = None,
+                            block_size: int = 50):
+    """
+    Runs Monte Carlo simulations for a specific seed and saves results to a CSV file.
+
+    Parameters:
+    - seed (int): Random seed for reproducibility.
+    - n_replications (int): Number of replications per seed (maximal number in
+        sequential mode, see `run_simulation_for_cells`).
+    - n_values (list[int]): Different values of `n_units` to simulate.
+    - beta_mean (float): Average coefficient value for generating data.
+    - mu_sigma_params (Dict[str, np.ndarray]): Dictionary containing:
+            - "mu_plus" (np.ndarray): Mean for covariates when effect is +1.
+            - "mu_minus" (np.ndarray): Mean for covariates when effect is -1.
+            - "sigma_plus" (np.ndarray): Covariance for X when effect is +1.
+            - "sigma_minus" (np.ndarray): Covariance for X when effect is -1.
+    - output_dir (str): Directory to save the CSV file.
+    - progress (ProgressReporter, optional): Reporter for live progress tracking.
+    - se_tolerance (float, optional): Target standard error for sequential
+        stopping. Defaults to None (fixed number of replications).
+    - block_size (int): Number of replications between stopping checks.
+    """
+    results = run_simulation_for_cells(seed, 
+                                       n_replications, 
+                                       n_values, 
+                                       beta_mean, 
+                                       mu_sigma_params, 
+                                       progress,
+                                       se_tolerance,
+                                       block_size)
 
     # Save results to CSV
     output_file = Path(output_dir) / f"results_seed_{seed}.csv"
@@ -0,0 +1,332 @@
+"""
+progress.py
+
+Live progress tracking for simulations running in a ProcessPoolExecutor.
+Python counterpart of the createParallelProgressBar tool for Matlab parfor
+loops: workers send updates to a queue, the main process renders them.
+
+Workers do not send a message per replication. Updates are accumulated
+locally and flushed at most once per `flush_interval` seconds (and at the end
+of every cell), so the cost of tracking stays negligible even for millions of
+replications.
+
+Classes:
+    - ProgressReporter: Worker-side handle that batches progress updates.
+    - ProgressTracker: Main-process listener that renders progress, throughput
+        and ETA, and surfaces failed futures.
+"""
+
+import multiprocessing
+import sys
+import threading
+import time
+
+from concurrent.futures import Future, as_completed
+from queue import Empty
+from typing import Any, Dict, Hashable, List, Optional, TextIO, Tuple
+
+
+def _format_duration(seconds: float) -> str:
+    """Formats a duration in seconds as H:MM:SS."""
+    if seconds != seconds or seconds == float("inf"):
+        return "--:--:--"
+    seconds = int(round(seconds))
+    return f"{seconds // 3600}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressReporter:
+    """
+    Worker-side progress handle. Picklable, so it can be passed to
+    executor.submit() together with the other arguments of a task.
+
+    Attributes:
+        queue: Queue shared with the ProgressTracker, or None to disable
+            reporting (all methods are then no-ops).
+        task_id (Hashable): Label of the task, e.g. the seed.
+        flush_interval (float): Minimal number of seconds between messages.
+    """
+
+    def __init__(
+        self,
+        queue: Optional[Any],
+        task_id: Hashable,
+        flush_interval: float = 0.5,
+    ) -> None:
+        self.queue = queue
+        self.task_id = task_id
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._skipped = 0
+        self._cell = None
+        self._cell_count = 0
+        self._cell_start = 0.0
+        self._last_flush = 0.0
+
+    def start_cell(self, cell: Hashable) -> None:
+        """
+        Marks the start of a new simulation cell (parameter combination).
+
+        Args:
+            cell (Hashable): Label of the cell, e.g. `n_units=1000`.
+        """
+        if self.queue is None:
+            return
+        self._cell = cell
+        self._cell_count = 0
+        self._cell_start = time.monotonic()
+
+    def advance(self, n: int = 1) -> None:
+        """
+        Records `n` finished replications. Only sends a message if the last
+        one was sent more than `flush_interval` seconds ago.
+
+        Args:
+            n (int): Number of finished replications.
+        """
+        if self.queue is None:
+            return
+        self._pending += n
+        self._cell_count += n
+        now = time.monotonic()
+        if now - self._last_flush >= self.flush_interval:
+            self._flush(now, cell_done=False)
+
+    def skip(self, n: int) -> None:
+        """
+        Removes `n` planned replications from the total, e.g. when a cell
+        stops early.
+
+        Args:
+            n (int): Number of replications that will not be run.
+        """
+        if self.queue is None:
+            return
+        self._skipped += n
+
+    def finish_cell(self) -> None:
+        """Marks the end of the current cell and flushes its statistics."""
+        if self.queue is None:
+            return
+        self._flush(time.monotonic(), cell_done=True)
+
+    def _flush(self, now: float, cell_done: bool) -> None:
+        self.queue.put((
+            self.task_id,
+            self._pending,
+            self._skipped,
+            self._cell,
+            self._cell_count,
+            now - self._cell_start,
+            cell_done,
+        ))
+        self._pending = 0
+        self._skipped = 0
+        self._last_flush = now
+
+
+class ProgressTracker:
+    """
+    Collects progress messages from workers in a background thread and
+    renders a throttled one-line summary with throughput and ETA.
+
+    Usage:
+        with ProgressTracker(total) as progress:
+            with ProcessPoolExecutor() as executor:
+                futures = {
+                    executor.submit(task, ..., progress.reporter(seed)): seed
+                    for seed in seeds
+                }
+                progress.wait(futures)
+
+    Attributes:
+        total (int): Total number of planned replications.
+        description (str): Label shown in front of the progress bar.
+        refresh_interval (float): Minimal number of seconds between renders.
+        stream (TextIO): Output stream. Lines are overwritten in place if it
+            is a terminal, otherwise a new line is written every
+            `log_interval` seconds.
+        cell_stats (Dict[Hashable, Dict[str, float]]): Number of
+            replications and worker-seconds per finished cell, summed over
+            tasks. See cell_throughput().
+    """
+
+    def __init__(
+        self,
+        total: int,
+        description: str = "Simulations",
+        refresh_interval: float = 0.5,
+        log_interval: float = 30.0,
+        stream: Optional[TextIO] = None,
+    ) -> None:
+        self.total = total
+        self.description = description
+        self.refresh_interval = refresh_interval
+        self.log_interval = log_interval
+        self.stream = sys.stderr if stream is None else stream
+        self.cell_stats: Dict[Hashable, Dict[str, float]] = {}
+        self.done = 0
+        self._is_tty = getattr(self.stream, "isatty", lambda: False)()
+        self._lock = threading.Lock()
+        self._manager = None
+        self._queue = None
+        self._thread = None
+        self._start = 0.0
+        self._last_render = 0.0
+        self._last_width = 0
+        self._last_cell = None
+
+    def __enter__(self) -> "ProgressTracker":
+        self._manager = multiprocessing.Manager()
+        self._queue = self._manager.Queue()
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._queue.put(None)
+        self._thread.join()
+        self._manager.shutdown()
+        self._render(final=True)
+
+    @property
+    def queue(self) -> Any:
+        """Queue to pass to workers (picklable manager proxy)."""
+        return self._queue
+
+    def reporter(self, task_id: Hashable) -> ProgressReporter:
+        """
+        Creates a worker-side reporter for a task.
+
+        Args:
+            task_id (Hashable): Label of the task, e.g. the seed.
+
+        Returns:
+            ProgressReporter: Reporter to pass to the worker.
+        """
+        return ProgressReporter(self._queue, task_id)
+
+    def extend(self, n: int) -> None:
+        """
+        Adds `n` planned replications to the total, e.g. when an adaptive
+        sweep schedules new points.
+
+        Args:
+            n (int): Number of additional replications.
+        """
+        with self._lock:
+            self.total += n
+
+    def cell_throughput(self) -> Dict[Hashable, float]:
+        """
+        Computes the throughput of every finished cell.
+
+        Returns:
+            Dict[Hashable, float]: Replications per worker-second by cell.
+        """
+        with self._lock:
+            return {
+                cell: stats["replications"] / stats["seconds"]
+                if stats["seconds"] > 0 else float("inf")
+                for cell, stats in self.cell_stats.items()
+            }
+
+    def wait(self, futures: Dict[Future, Hashable]) -> List[Any]:
+        """
+        Waits for all futures and reports failures as soon as they happen.
+
+        Args:
+            futures (Dict[Future, Hashable]): Futures mapped to task labels.
+
+        Returns:
+            List[Any]: Results of the futures in completion order.
+
+        Raises:
+            RuntimeError: If at least one future raised an exception.
+        """
+        results = []
+        failed = []
+        for future in as_completed(futures):
+            exception = future.exception()
+            if exception is None:
+                results.append(future.result())
+                continue
+            failed.append(futures[future])
+            self._write_line(
+                f"Task {futures[future]} failed: "
+                f"{type(exception).__name__}: {exception}"
+            )
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} of {len(futures)} tasks failed: {failed}"
+            )
+        return results
+
+    def _listen(self) -> None:
+        """Drains the queue and renders progress until a None sentinel."""
+        while True:
+            try:
+                message = self._queue.get(timeout=self.refresh_interval)
+            except Empty:
+                self._render()
+                continue
+            if message is None:
+                return
+            self._update(message)
+            self._render()
+
+    def _update(self, message: Tuple) -> None:
+        task_id, n, skipped, cell, cell_count, cell_elapsed, cell_done = message
+        with self._lock:
+            self.done += n
+            self.total -= skipped
+            if cell_done:
+                stats = self.cell_stats.setdefault(
+                    cell, {"replications": 0, "seconds": 0.0}
+                )
+                stats["replications"] += cell_count
+                stats["seconds"] += cell_elapsed
+                self._last_cell = (cell, cell_count, cell_elapsed)
+
+    def _status_line(self) -> str:
+        elapsed = time.monotonic() - self._start
+        share = self.done / self.total if self.total else 1.0
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        filled = int(20 * min(share, 1.0))
+        line = (
+            f"{self.description} [{'#' * filled}{'-' * (20 - filled)}] "
+            f"{100 * share:5.1f}% {self.done}/{self.total} | "
+            f"{rate:,.1f} rep/s | elapsed {_format_duration(elapsed)} | "
+            f"ETA {_format_duration(eta)}"
+        )
+        if self._last_cell is not None:
+            cell, cell_count, cell_elapsed = self._last_cell
+            cell_rate = cell_count / cell_elapsed if cell_elapsed > 0 else 0.0
+            line += f" | last cell {cell}: {cell_rate:,.1f} rep/s"
+        return line
+
+    def _render(self, final: bool = False) -> None:
+        now = time.monotonic()
+        interval = self.refresh_interval if self._is_tty else self.log_interval
+        if not final and now - self._last_render < interval:
+            return
+        self._last_render = now
+        with self._lock:
+            line = self._status_line()
+            if self._is_tty:
+                padding = " " * max(self._last_width - len(line), 0)
+                self.stream.write("\r" + line + padding + ("\n" if final else ""))
+                self._last_width = 0 if final else len(line)
+            else:
+                self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def _write_line(self, text: str) -> None:
+        """Writes a message on its own line without breaking the bar."""
+        with self._lock:
+            if self._is_tty and self._last_width:
+                self.stream.write("\r" + " " * self._last_width + "\r")
+                self._last_width = 0
+            self.stream.write(text + "\n")
+            self.stream.flush()
@@ -0,0 +1,372 @@
+"""
+task_queue.py
+
+File-based task queue for running simulations on several machines that
+share a filesystem. A coordinator publishes tasks to a queue folder, and
+workers on any node pull, run and commit them.
+
+Queue folder layout:
+    tasks/<id>.task           published tasks: pickled (function, args, kwargs)
+    leases/<id>@<claim>.task  tasks claimed by a worker; <claim> is
+                              <host>.<pid>.<nonce>, unique for every claim
+    results/<id>.result       pickled ("ok", value) or ("error", traceback)
+    closed                    marker: no more tasks will be published
+
+A worker claims a task by renaming it from tasks/ to a lease in leases/ (an
+atomic operation, so only one worker gets it) and renews the lease by
+touching the file while the task runs. Every claim has its own lease name,
+so a worker whose lease expired never touches or removes the lease of the
+worker that claimed the task after it. Leases that have not been renewed for
+`lease_timeout` seconds belong to dead workers and are moved back to tasks/
+by the coordinator or by any worker. Results are written to a temporary file
+and renamed, and a failure never replaces a successful result. Task ids are
+derived from a hash of the task (see make_task_id), so a task that runs
+twice commits the same result, rerunning the coordinator on the same folder
+resumes from the committed results, and tasks whose arguments or the
+module of whose function changed never reuse the results of earlier runs.
+Edits to other modules called by the function are not detected; use a new
+queue folder after them. Lease expiry compares file modification times with
+the local clock, so node clocks should be synchronized.
+
+Start a worker on a node from the project folder with
+    python -m utils.task_queue <queue_dir>
+Workers exit once the queue is closed and drained.
+
+Classes:
+    - FileTaskQueue: Publishes, claims, runs and collects tasks.
+
+Functions:
+    - make_task_id(prefix: str, fn: Callable, *args, **kwargs) -> str:
+        Deterministic id of a task, including a hash of what it computes.
+    - run_worker(queue_dir: str, lease_timeout: float = 600.0,
+            poll_interval: float = 1.0) -> int:
+        Runs tasks from the queue until it is closed and drained.
+    - start_local_workers(queue_dir: str, num_workers: int,
+            lease_timeout: float = 600.0) -> List[multiprocessing.Process]:
+        Starts worker processes on this machine (stand-ins for nodes).
+"""
+
+import argparse
+import hashlib
+import inspect
+import multiprocessing
+import os
+import pickle
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.progress import ProgressReporter
+
+# Fixed pickle protocol, so that task ids do not depend on the Python version
+TASK_PICKLE_PROTOCOL = 4
+
+
+def make_task_id(prefix: str, fn: Callable, *args, **kwargs) -> str:
+    """
+    Deterministic id of a task: a readable prefix followed by a hash of the
+    pickled (function, args, kwargs) and of the source code of the module of
+    the function (pickle only stores the function by name). Changing any
+    argument of a task, e.g. the sample size or the DGP parameters, or
+    editing the module of its function changes its id.
+
+    Args:
+        prefix (str): Readable part of the id (usable in a file name).
+        fn (Callable): Module-level function of the task.
+        *args, **kwargs: Arguments of fn.
+
+    Returns:
+        str: Id of the task.
+    """
+    digest = hashlib.sha256()
+    digest.update(pickle.dumps((fn, args, kwargs), protocol=TASK_PICKLE_PROTOCOL))
+    digest.update(inspect.getsource(inspect.getmodule(fn)).encode())
+    return f"{prefix}_{digest.hexdigest()[:16]}"
+
+
+class FileTaskQueue:
+    """
+    Task queue stored in a (shared) folder.
+
+    Attributes:
+        queue_dir (Path): Root folder of the queue.
+        lease_timeout (float): Seconds after which a lease that has not been
+            renewed is considered dead and its task is re-queued.
+        poll_interval (float): Seconds between polls of the folder.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        lease_timeout: float = 600.0,
+        poll_interval: float = 1.0,
+    ) -> None:
+        self.queue_dir = Path(queue_dir)
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._tasks = self.queue_dir / "tasks"
+        self._leases = self.queue_dir / "leases"
+        self._results = self.queue_dir / "results"
+        for folder in (self._tasks, self._leases, self._results):
+            folder.mkdir(parents=True, exist_ok=True)
+
+    def _write_atomic(self, path: Path, obj: Any) -> None:
+        """Pickles obj to a temporary file and renames it to path."""
+        tmp = path.with_name(
+            f".{path.name}.{socket.gethostname()}.{os.getpid()}."
+            f"{threading.get_ident()}.tmp"
+        )
+        with open(tmp, "wb") as file:
+            pickle.dump(obj, file)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _task_id(path: Path) -> str:
+        """Task id of a task or lease file."""
+        return path.name[: -len(".task")].split("@")[0]
+
+    def _has_ok_result(self, task_id: str) -> bool:
+        """Whether the task has a committed successful result."""
+        try:
+            with open(self._results / f"{task_id}.result", "rb") as file:
+                return pickle.load(file)[0] == "ok"
+        except FileNotFoundError:
+            return False
+
+    def publish(self, task_id: str, fn: Callable, *args, **kwargs) -> bool:
+        """
+        Publishes a task unless it already has a successful result. Failed
+        results are discarded, so that the task runs again.
+
+        Args:
+            task_id (str): Deterministic, unique id of the task (usable as a
+                file name, without "@"), e.g. from make_task_id.
+            fn (Callable): Module-level function to run.
+            *args, **kwargs: Arguments of fn.
+
+        Returns:
+            bool: True if the task was published, False if its result exists.
+        """
+        if self._has_ok_result(task_id):
+            return False
+        (self._results / f"{task_id}.result").unlink(missing_ok=True)
+        self._write_atomic(self._tasks / f"{task_id}.task", (fn, args, kwargs))
+        return True
+
+    def close(self) -> None:
+        """Marks that no more tasks will be published."""
+        (self.queue_dir / "closed").touch()
+
+    def reopen(self) -> None:
+        """Removes the closed marker of a previous run."""
+        (self.queue_dir / "closed").unlink(missing_ok=True)
+
+    def is_drained(self) -> bool:
+        """Whether the queue is closed and has no waiting or running tasks."""
+        return (
+            (self.queue_dir / "closed").exists()
+            and not any(self._tasks.glob("*.task"))
+            and not any(self._leases.glob("*.task"))
+        )
+
+    def requeue_expired(self) -> int:
+        """
+        Moves tasks whose lease has not been renewed in time back to tasks/.
+
+        Returns:
+            int: Number of re-queued tasks.
+        """
+        now = time.time()
+        requeued = 0
+        for lease in self._leases.glob("*.task"):
+            try:
+                if now - lease.stat().st_mtime <= self.lease_timeout:
+                    continue
+                os.rename(lease, self._tasks / f"{self._task_id(lease)}.task")
+                requeued += 1
+            except FileNotFoundError:
+                continue  # finished or re-queued by someone else
+        return requeued
+
+    def claim(self) -> Optional[Path]:
+        """
+        Claims a random published task. Tasks that already have a successful
+        result (e.g. re-queued after a slow worker committed it) are dropped.
+
+        Returns:
+            Optional[Path]: Path of the lease, or None if no task is waiting.
+        """
+        candidates = list(self._tasks.glob("*.task"))
+        random.shuffle(candidates)
+        for task in candidates:
+            task_id = self._task_id(task)
+            lease = self._leases / (
+                f"{task_id}@{socket.gethostname()}.{os.getpid()}."
+                f"{uuid.uuid4().hex}.task"
+            )
+            try:
+                # Touch before renaming, so that the lease is not expired
+                # (the rename keeps the modification time of the task)
+                os.utime(task)
+                os.rename(task, lease)
+                os.utime(lease)
+            except FileNotFoundError:
+                continue  # claimed by another worker, or lease re-queued
+            if self._has_ok_result(task_id):
+                lease.unlink(missing_ok=True)
+                continue
+            return lease
+        return None
+
+    def run_claimed(self, lease: Path) -> None:
+        """
+        Runs a claimed task, renewing the lease while it runs, and commits
+        its result (or its traceback, if it fails and no other worker has
+        committed a successful result meanwhile).
+
+        Args:
+            lease (Path): Path returned by claim().
+        """
+        task_id = self._task_id(lease)
+        try:
+            with open(lease, "rb") as file:
+                fn, args, kwargs = pickle.load(file)
+        except FileNotFoundError:
+            return  # lease expired and the task was re-queued meanwhile
+        stop = threading.Event()
+
+        def renew() -> None:
+            while not stop.wait(self.lease_timeout / 4):
+                try:
+                    os.utime(lease)
+                except FileNotFoundError:
+                    return
+
+        heartbeat = threading.Thread(target=renew, daemon=True)
+        heartbeat.start()
+        try:
+            outcome = ("ok", fn(*args, **kwargs))
+        except Exception:
+            outcome = ("error", traceback.format_exc())
+        finally:
+            stop.set()
+            heartbeat.join()
+        if outcome[0] == "ok" or not self._has_ok_result(task_id):
+            self._write_atomic(self._results / f"{task_id}.result", outcome)
+        # Only this claim's lease; a re-queued task has a new lease name
+        lease.unlink(missing_ok=True)
+
+    def wait(
+        self,
+        task_sizes: Dict[str, int],
+        progress: Optional[ProgressReporter] = None,
+    ) -> Dict[str, Any]:
+        """
+        Waits for the results of the given tasks, re-queueing expired leases.
+
+        Args:
+            task_sizes (Dict[str, int]): Task ids with their number of
+                replications (used for progress reporting).
+            progress (ProgressReporter, optional): Reporter to advance as
+                results arrive.
+
+        Returns:
+            Dict[str, Any]: Results by task id.
+
+        Raises:
+            RuntimeError: If a task failed; includes the worker traceback.
+        """
+        if progress is not None:
+            progress.start_cell(self.queue_dir.name)
+        results = {}
+        while len(results) < len(task_sizes):
+            self.requeue_expired()
+            committed = {path.stem for path in self._results.glob("*.result")}
+            for task_id in (committed & task_sizes.keys()) - results.keys():
+                path = self._results / f"{task_id}.result"
+                with open(path, "rb") as file:
+                    status, value = pickle.load(file)
+                if status == "error":
+                    raise RuntimeError(f"Task {task_id} failed:\n{value}")
+                results[task_id] = value
+                if progress is not None:
+                    progress.advance(task_sizes[task_id])
+            if len(results) < len(task_sizes):
+                time.sleep(self.poll_interval)
+        if progress is not None:
+            progress.finish_cell()
+        return results
+
+
+def run_worker(
+    queue_dir: str,
+    lease_timeout: float = 600.0,
+    poll_interval: float = 1.0,
+) -> int:
+    """
+    Runs tasks from the queue until it is closed and drained.
+
+    Args:
+        queue_dir (str): Root folder of the queue.
+        lease_timeout (float): Lease timeout, must match the coordinator.
+        poll_interval (float): Seconds to wait when no task is available.
+
+    Returns:
+        int: Number of tasks run by this worker.
+    """
+    queue = FileTaskQueue(queue_dir, lease_timeout, poll_interval)
+    num_tasks = 0
+    while True:
+        lease = queue.claim()
+        if lease is not None:
+            queue.run_claimed(lease)
+            num_tasks += 1
+            continue
+        if queue.is_drained():
+            return num_tasks
+        queue.requeue_expired()
+        time.sleep(poll_interval)
+
+
+def start_local_workers(
+    queue_dir: str,
+    num_workers: int,
+    lease_timeout: float = 600.0,
+) -> List[multiprocessing.Process]:
+    """
+    Starts worker processes on this machine. Useful for testing the
+    distributed setup with local processes standing in for nodes.
+
+    Args:
+        queue_dir (str): Root folder of the queue.
+        num_workers (int): Number of worker processes.
+        lease_timeout (float): Lease timeout, must match the coordinator.
+
+    Returns:
+        List[multiprocessing.Process]: The started processes.
+    """
+    workers = [
+        multiprocessing.Process(
+            target=run_worker, args=(queue_dir, lease_timeout), daemon=True
+        )
+        for _ in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation queue worker.")
+    parser.add_argument("queue_dir")
+    parser.add_argument("--lease-timeout", type=float, default=600.0)
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    args = parser.parse_args()
+    num_tasks = run_worker(args.queue_dir, args.lease_timeout, args.poll_interval)
+    print(f"Queue drained after running {num_tasks} tasks")
@@ -0,0 +1,352 @@
+"""
+worker_pool.py
+
+Warm worker pools for the simulations. Starting a worker and importing
+pandas and pyfixest (with numba) takes longer than many simulation tasks, so
+this module avoids paying that cost repeatedly:
+
+- create_executor() returns a ProcessPoolExecutor whose workers are forked
+  from a forkserver that has already imported PRELOAD_MODULES. Workers start
+  in milliseconds instead of re-importing everything. Given a number of
+  threads per worker, the thread pools of the workers are pinned to it (see
+  utils.execution).
+- A long-lived pool daemon keeps warm workers between invocations of
+  main.py. Start it from the project folder with
+      python -m utils.worker_pool
+  and pass --pool to main.py to submit to it. WarmPoolClient implements the
+  Executor interface, so it is a drop-in replacement for the local pool.
+  The daemon keeps running the code it was started with, so it must be
+  restarted after the project code changes; clients compare a hash of the
+  project sources with the daemon's and refuse to submit to a stale daemon.
+
+The daemon listens on localhost only and runs pickled tasks, so every
+connection must authenticate. Client and daemon use the key in the
+SIMULATION_POOL_AUTHKEY environment variable if set; otherwise the daemon
+generates a random key and writes it to a file that only its owner can read
+(see AUTHKEY_DIR), from which clients of the same user read it.
+
+Functions:
+    - create_executor(max_workers: Optional[int] = None,
+            preload: Optional[List[str]] = None,
+            threads_per_worker: Optional[int] = None,
+            kernel_threads: bool = False) -> ProcessPoolExecutor:
+        Process pool forked from a preloaded forkserver, where available.
+    - project_source_digest() -> str:
+        Hash of all Python sources of the project.
+    - serve_pool(address: Tuple[str, int], max_workers: Optional[int] = None,
+            authkey: Optional[bytes] = None,
+            threads_per_worker: Optional[int] = None) -> None:
+        Runs the pool daemon until interrupted.
+
+Classes:
+    - WarmPoolClient: Executor that runs tasks on the pool daemon.
+"""
+
+import argparse
+import hashlib
+import importlib
+import multiprocessing
+import os
+import secrets
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from utils.execution import pin_threads, plan_split, thread_limit_environment
+
+# Modules imported once in the forkserver and inherited by all workers
+PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "pyfixest",
+    "simulation.run_simulation",
+]
+
+DEFAULT_ADDRESS = ("127.0.0.1", 47321)
+
+# Root folder of the project, whose sources the daemon runs
+PROJECT_DIR = Path(__file__).resolve().parents[1]
+
+# Folder of the keys generated by pool daemons, readable by their owner only
+AUTHKEY_DIR = Path.home() / ".cache" / "simulation_pool"
+
+# Pool of the daemon process and hash of the sources it runs, set by serve_pool
+_DAEMON_EXECUTOR = None
+_DAEMON_SOURCE_DIGEST = None
+
+
+def _authkey_file(address: Tuple[str, int]) -> Path:
+    """File with the generated key of the daemon listening on address."""
+    return AUTHKEY_DIR / f"authkey_{address[0]}_{address[1]}"
+
+
+def _environment_authkey() -> Optional[bytes]:
+    """Key in the SIMULATION_POOL_AUTHKEY environment variable, if set."""
+    authkey = os.environ.get("SIMULATION_POOL_AUTHKEY")
+    return authkey.encode() if authkey else None
+
+
+def _generate_authkey(address: Tuple[str, int]) -> bytes:
+    """
+    Generates a random key for the daemon on address and writes it to a file
+    that only the current user can read.
+    """
+    authkey = secrets.token_hex(32).encode()
+    AUTHKEY_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    path = _authkey_file(address)
+    path.unlink(missing_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as file:
+        file.write(authkey)
+    return authkey
+
+
+def _client_authkey(address: Tuple[str, int]) -> bytes:
+    """
+    Key of the daemon on address: the environment variable, or the file
+    written by the daemon.
+
+    Raises:
+        ConnectionError: If neither exists, i.e. no daemon was started.
+    """
+    authkey = _environment_authkey()
+    if authkey is not None:
+        return authkey
+    try:
+        return _authkey_file(address).read_bytes()
+    except FileNotFoundError as e:
+        raise ConnectionError(
+            f"No worker pool at {address[0]}:{address[1]}. Start one "
+            "with: python -m utils.worker_pool"
+        ) from e
+
+
+def project_source_digest() -> str:
+    """Hash of all Python sources of the project."""
+    digest = hashlib.sha256()
+    for path in sorted(PROJECT_DIR.rglob("*.py")):
+        relative = path.relative_to(PROJECT_DIR)
+        if any(part.startswith(".") for part in relative.parts):
+            continue
+        digest.update(str(relative).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _import_modules(modules: List[str]) -> None:
+    """Imports the given modules in a worker (no-op if preloaded)."""
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _start_forkserver(threads_per_worker: Optional[int]) -> None:
+    """
+    Starts the forkserver (if not yet running) with the thread-limit
+    environment, so that the preloaded libraries start small thread pools.
+    """
+    import multiprocessing.forkserver
+
+    limits = {} if threads_per_worker is None else thread_limit_environment(
+        threads_per_worker
+    )
+    saved = {variable: os.environ.get(variable) for variable in limits}
+    os.environ.update(limits)
+    try:
+        multiprocessing.forkserver.ensure_running()
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                del os.environ[variable]
+            else:
+                os.environ[variable] = value
+
+
+def create_executor(
+    max_workers: Optional[int] = None,
+    preload: Optional[List[str]] = None,
+    threads_per_worker: Optional[int] = None,
+    kernel_threads: bool = False,
+) -> ProcessPoolExecutor:
+    """
+    Creates a process pool whose workers are forked from a forkserver with
+    preloaded modules. Falls back to the default start method on platforms
+    without forkserver (e.g. Windows).
+
+    Args:
+        max_workers (int, optional): Number of worker processes. Defaults to
+            the number of CPUs.
+        preload (List[str], optional): Modules to import in the forkserver.
+            Defaults to PRELOAD_MODULES.
+        threads_per_worker (int, optional): Threads of every worker, to which
+            BLAS/OpenMP/numba are pinned. Defaults to None (not pinned).
+        kernel_threads (bool): Use the threads of every worker for batched
+            kernels (see utils.execution.kernel_map) and pin BLAS/OpenMP to
+            a single thread instead.
+
+    Returns:
+        ProcessPoolExecutor: The process pool.
+    """
+    pinning = {}
+    if threads_per_worker is not None:
+        pinning = {
+            "initializer": pin_threads,
+            "initargs": (threads_per_worker, kernel_threads),
+        }
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers, **pinning)
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD_MODULES if preload is None else preload)
+    _start_forkserver(
+        1 if kernel_threads and threads_per_worker is not None else threads_per_worker
+    )
+    return ProcessPoolExecutor(max_workers, mp_context=context, **pinning)
+
+
+class _PoolService:
+    """Runs tasks on the daemon pool; one instance per connected client."""
+
+    def run(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        return _DAEMON_EXECUTOR.submit(fn, *args, **kwargs).result()
+
+    def num_workers(self) -> int:
+        return _DAEMON_EXECUTOR._max_workers
+
+    def source_digest(self) -> str:
+        return _DAEMON_SOURCE_DIGEST
+
+
+class _PoolManager(BaseManager):
+    pass
+
+
+_PoolManager.register("PoolService", _PoolService)
+
+
+def serve_pool(
+    address: Tuple[str, int] = DEFAULT_ADDRESS,
+    max_workers: Optional[int] = None,
+    authkey: Optional[bytes] = None,
+    threads_per_worker: Optional[int] = None,
+) -> None:
+    """
+    Starts warm workers and serves tasks from WarmPoolClient instances until
+    interrupted. Must be started from the project folder, so that tasks can
+    be unpickled.
+
+    Args:
+        address (Tuple[str, int]): Host and port to listen on.
+        max_workers (int, optional): Number of worker processes. Defaults to
+            the number of CPUs.
+        authkey (bytes, optional): Authentication key. Defaults to the
+            SIMULATION_POOL_AUTHKEY environment variable, or to a random key
+            written to a file in AUTHKEY_DIR (removed when the daemon stops).
+        threads_per_worker (int, optional): Threads of every worker, see
+            create_executor. Defaults to the split of utils.execution.plan_split.
+    """
+    global _DAEMON_EXECUTOR, _DAEMON_SOURCE_DIGEST
+    _DAEMON_SOURCE_DIGEST = project_source_digest()
+    authkey_file = None
+    if authkey is None:
+        authkey = _environment_authkey()
+    if authkey is None:
+        authkey = _generate_authkey(address)
+        authkey_file = _authkey_file(address)
+
+    # Workers inherit the key, so that they can reach the progress queues
+    # that clients create with the same key
+    multiprocessing.current_process().authkey = authkey
+    max_workers, threads_per_worker = plan_split(max_workers, threads_per_worker)
+    _DAEMON_EXECUTOR = create_executor(
+        max_workers, threads_per_worker=threads_per_worker
+    )
+    num_workers = _DAEMON_EXECUTOR._max_workers
+    list(_DAEMON_EXECUTOR.map(_import_modules, [PRELOAD_MODULES] * num_workers))
+
+    server = _PoolManager(address=address, authkey=authkey).get_server()
+    print(
+        f"Worker pool with {num_workers} warm workers "
+        f"({threads_per_worker} threads each) listening on "
+        f"{address[0]}:{address[1]}"
+    )
+    try:
+        server.serve_forever()
+    finally:
+        _DAEMON_EXECUTOR.shutdown(cancel_futures=True)
+        if authkey_file is not None:
+            authkey_file.unlink(missing_ok=True)
+
+
+class WarmPoolClient(Executor):
+    """
+    Executor that forwards tasks to the pool daemon started by serve_pool.
+    Every submitted task occupies a local thread while it runs remotely, so
+    the returned futures behave like those of a local ProcessPoolExecutor.
+
+    Create the client before any ProgressTracker: the client sets the
+    authentication key of the current process, which the tracker's queue
+    uses.
+
+    Attributes:
+        address (Tuple[str, int]): Address of the daemon.
+        num_workers (int): Number of workers of the daemon.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = DEFAULT_ADDRESS,
+        authkey: Optional[bytes] = None,
+        max_pending: int = 256,
+    ) -> None:
+        """
+        Connects to the pool daemon.
+
+        Args:
+            address (Tuple[str, int]): Address of the daemon.
+            authkey (bytes, optional): Authentication key. Defaults to the
+                SIMULATION_POOL_AUTHKEY environment variable, or to the key
+                file written by the daemon.
+            max_pending (int): Maximal number of concurrently running tasks.
+
+        Raises:
+            ConnectionError: If no daemon listens on the address.
+            RuntimeError: If the daemon runs other project sources, i.e. the
+                code changed since it was started.
+        """
+        authkey = _client_authkey(address) if authkey is None else authkey
+        multiprocessing.current_process().authkey = authkey
+        self.address = address
+        manager = _PoolManager(address=address, authkey=authkey)
+        try:
+            manager.connect()
+        except OSError as e:
+            raise ConnectionError(
+                f"No worker pool at {address[0]}:{address[1]}. Start one "
+                "with: python -m utils.worker_pool"
+            ) from e
+        self._service = manager.PoolService()
+        if self._service.source_digest() != project_source_digest():
+            raise RuntimeError(
+                "The worker pool runs an older version of the project code. "
+                "Restart it with: python -m utils.worker_pool"
+            )
+        self.num_workers = self._service.num_workers()
+        self._threads = ThreadPoolExecutor(max_pending)
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        return self._threads.submit(self._service.run, fn, args, kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._threads.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm simulation worker pool.")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    args = parser.parse_args()
+    serve_pool((args.host, args.port), args.workers, threads_per_worker=args.threads)
@@ -0,0 +1,231 @@
+"""
+kde_animation.py
+
+Renders the animated summary of the post: for every number of units, kernel
+density estimates of the coefficient estimates of the pooled OLS and FE
+estimators, compared to the average coefficient. Densities are computed with
+the binned FFT estimator of `utils.binned_kde`.
+
+write_frame_slices reads the combined results in chunks and saves the
+estimates of every `n_units` in its own CSV slice; the slices are rewritten
+only when the combined results change. The frames are then rendered in
+parallel from these slices and cached, and the animation is stream-encoded
+(see `utils.animation`).
+
+Run from the project folder after the simulations with
+    python -m visualization.kde_animation [--output FILE] [--workers N]
+The output may be a .gif or an .mp4 file (the latter requires ffmpeg). Frames
+are cached in ANIMATION_DIR.
+
+Functions:
+    - write_frame_slices(combined_file: str, slice_dir: str,
+            chunksize: int = 1_000_000) -> List[Path]:
+        Splits the combined results into one slice of estimates per `n_units`.
+    - draw_kde_frame(figure: Figure, frame_data: pd.DataFrame,
+            style: Dict[str, Any]) -> None:
+        Draws the densities of the estimates for a single `n_units`.
+    - render_kde_animation(output_file: str, results_dir: str,
+            animation_dir: str, frame_duration: float,
+            max_workers: Optional[int] = None) -> None:
+        Slices the results, renders the frames and encodes the animation.
+"""
+
+import argparse
+import os
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_generation.parameters import (
+    ANIMATION_DIR,
+    ANIMATION_FRAME_DURATION,
+    BETA_MEAN,
+    OUTPUT_DIR,
+)
+from utils import binned_kde
+from utils.animation import cached_frame_slices, encode_animation, render_frames
+from utils.binned_kde import group_densities
+from utils.worker_pool import create_executor
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+# Modules imported once in the forkserver of the rendering workers
+RENDER_PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "utils.binned_kde",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+    "utils.animation",
+]
+
+MODEL_STYLES = {
+    "no_effects": {"label": "No fixed effects", "color": "#1f77b4"},
+    "fixed_effects": {"label": "Fixed effects", "color": "#d62728"},
+}
+
+def write_frame_slices(
+    combined_file: str,
+    slice_dir: str,
+    chunksize: int = 1_000_000,
+) -> List[Path]:
+    """
+    Splits the combined results into one slice of estimates per `n_units`.
+
+    Reads the results in chunks and appends every chunk to the slices, so
+    that memory use is bounded by the chunk size. Slices of a previous run
+    that no longer correspond to a value of `n_units` are removed.
+
+    Args:
+        combined_file (str): Combined simulation results.
+        slice_dir (str): Folder of the slices.
+        chunksize (int): Number of rows read at once.
+
+    Returns:
+        List[Path]: Slices with columns `n_units`, `model` and `coef_est`,
+            ordered by `n_units`.
+    """
+    slice_dir = Path(slice_dir)
+    slice_dir.mkdir(parents=True, exist_ok=True)
+    tmp_files = {}
+    for chunk in pd.read_csv(
+        combined_file, usecols=["n_units", "model", "coef_est"], chunksize=chunksize
+    ):
+        for n_units, estimates in chunk.groupby("n_units"):
+            if n_units not in tmp_files:
+                tmp_files[n_units] = slice_dir / f".units_{n_units:06d}.csv.tmp"
+                estimates.to_csv(tmp_files[n_units], index=False)
+            else:
+                estimates.to_csv(
+                    tmp_files[n_units], mode="a", header=False, index=False
+                )
+
+    slice_files = []
+    for n_units in sorted(tmp_files):
+        slice_file = slice_dir / f"units_{n_units:06d}.csv"
+        os.replace(tmp_files[n_units], slice_file)
+        slice_files.append(slice_file)
+    for stale_file in set(slice_dir.glob("units_*.csv")) - set(slice_files):
+        stale_file.unlink()
+    return slice_files
+
+def _common_xlim(slice_files: List[Path], step: float = 0.05) -> List[float]:
+    """
+    Range covering the central 99% of the estimates of every slice, rounded
+    outwards to multiples of `step`, so that small changes of the results do
+    not change the limits (and invalidate all cached frames).
+    """
+    lower, upper = np.inf, -np.inf
+    for slice_file in slice_files:
+        estimates = pd.read_csv(slice_file, usecols=["coef_est"])["coef_est"]
+        lower = min(lower, estimates.quantile(0.005))
+        upper = max(upper, estimates.quantile(0.995))
+    return [
+        float(np.floor(min(lower, BETA_MEAN) / step) * step),
+        float(np.ceil(max(upper, BETA_MEAN) / step) * step),
+    ]
+
+def draw_kde_frame(
+    figure: "Figure",
+    frame_data: pd.DataFrame,
+    style: Dict[str, Any],
+) -> None:
+    """
+    Draws the densities of the estimates of both models for a single `n_units`.
+
+    Args:
+        figure (Figure): Matplotlib figure to draw on.
+        frame_data (pd.DataFrame): Slice written by `write_frame_slices`.
+        style (Dict[str, Any]): Shared style, with the axis limits "xlim" and
+            the average coefficient "beta_mean".
+    """
+    densities = group_densities(
+        frame_data, "coef_est", ["model"], *style["xlim"], style["grid_size"]
+    )
+    ax = figure.subplots()
+    for model, model_style in MODEL_STYLES.items():
+        if model not in densities:
+            continue
+        density = densities[model]
+        ax.plot(density.index, density, linewidth=2, **model_style)
+        ax.fill_between(density.index, density, alpha=0.2, color=model_style["color"])
+    ax.axvline(
+        style["beta_mean"],
+        color="black",
+        linestyle="--",
+        linewidth=1,
+        label="Average coefficient",
+    )
+    ax.set_xlim(style["xlim"])
+    ax.set_ylim(bottom=0)
+    ax.set_xlabel("Coefficient estimate")
+    ax.set_ylabel("Density")
+    ax.set_title(f"Number of units: {frame_data['n_units'].iloc[0]}")
+    ax.legend(loc="best")
+    ax.grid(alpha=0.3)
+    figure.tight_layout()
+
+def render_kde_animation(
+    output_file: str,
+    results_dir: str = OUTPUT_DIR,
+    animation_dir: str = ANIMATION_DIR,
+    frame_duration: float = ANIMATION_FRAME_DURATION,
+    max_workers: Optional[int] = None,
+) -> None:
+    """
+    Slices the results, renders the frames in parallel and encodes them.
+
+    Args:
+        output_file (str): Path of the .gif or .mp4 animation.
+        results_dir (str): Folder with `combined_results.csv`.
+        animation_dir (str): Folder of the slices and the frame cache.
+        frame_duration (float): Seconds per frame.
+        max_workers (int, optional): Number of rendering processes. Defaults
+            to the number of CPUs.
+    """
+    slice_files = cached_frame_slices(
+        write_frame_slices,
+        Path(results_dir) / "combined_results.csv",
+        Path(animation_dir) / "slices",
+    )
+    style = {
+        "figsize": [8, 4.5],
+        "dpi": 100,
+        "xlim": _common_xlim(slice_files),
+        "beta_mean": BETA_MEAN,
+        "grid_size": 4096,
+    }
+    with create_executor(max_workers, RENDER_PRELOAD_MODULES) as executor:
+        frame_images = render_frames(
+            draw_kde_frame,
+            slice_files,
+            style,
+            Path(animation_dir) / "frames",
+            executor,
+            dependencies=[binned_kde],
+        )
+    encode_animation(frame_images, output_file, frame_duration)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Animated densities of estimates.")
+    parser.add_argument(
+        "--output", default=str(Path(OUTPUT_DIR) / "fe_bias_kde.gif")
+    )
+    parser.add_argument("--results-dir", default=OUTPUT_DIR)
+    parser.add_argument("--animation-dir", default=ANIMATION_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--frame-duration", type=float, default=ANIMATION_FRAME_DURATION
+    )
+    args = parser.parse_args()
+    render_kde_animation(
+        args.output,
+        args.results_dir,
+        args.animation_dir,
+        frame_duration=args.frame_duration,
+        max_workers=args.workers,
+    )
@@ -22,6 +22,8 @@ Steps:
 2. Extracts subsample of interest (white married women);
 3. Runs the OLS regression of interest.
 4. Applies the delta method to a nonlinear transformation of parameters.
+5. Inverts the Wald test over a grid of values and tests two nonlinear
+   transformations jointly with the vectorized delta method.
 
 The nonlinear transformation of interest is the number of years of experience
 that maximizes the expected earnings.
@@ -36,7 +38,10 @@ or
 """
 
 from scripts.data_preparation import load_and_prepare_data, run_ols_regression
-from scripts.delta_method_analysis import perform_delta_method_analysis
+from scripts.delta_method_analysis import (
+    perform_delta_method_analysis,
+    perform_vectorized_analysis,
+)
 
 
 def main():
@@ -50,6 +55,9 @@ def main():
     # Perform delta method analysis
     perform_delta_method_analysis(results)
 
+    # Grid and joint tests with the vectorized delta method
+    perform_vectorized_analysis(results)
+
 
 if __name__ == "__main__":
     main()
@@ -10,12 +10,19 @@ It showcases three methods of NonlinearDeltaCov
 - A summary method;
 - A confidence interval method;
 - A Wald test method.
+
+It then repeats the analysis with the vectorized delta method of
+scripts/vectorized_delta_method.py: testing a whole grid of experience
+values at once, inverting the test into a confidence set, and jointly
+testing two transformations.
 """
 
 import numpy as np
 import pandas as pd
 from statsmodels.stats._delta_method import NonlinearDeltaCov
 
+from scripts.vectorized_delta_method import VectorizedDeltaMethod
+
 
 def max_earn(beta: pd.Series) -> np.ndarray:
     """Calculate the number of years of experience that maximize earnings."""
@@ -24,6 +31,23 @@ def max_earn(beta: pd.Series) -> np.ndarray:
     )
 
 
+def max_earn_jacobian(beta: pd.Series) -> np.ndarray:
+    """Analytic Jacobian of max_earn with respect to all coefficients."""
+    jacobian = pd.Series(0.0, index=beta.index)
+    jacobian.loc["experience"] = -50 / beta.loc["experience_sq_div"]
+    jacobian.loc["experience_sq_div"] = (
+        50 * beta.loc["experience"] / beta.loc["experience_sq_div"] ** 2
+    )
+    return jacobian.to_numpy()[None, :]
+
+
+def decade_growth(beta: pd.Series) -> np.ndarray:
+    """Calculate the log wage growth over the first ten years of experience."""
+    return np.array(
+        [10 * beta.loc["experience"] + beta.loc["experience_sq_div"]]
+    )
+
+
 def perform_delta_method_analysis(results):
     """Perform delta method analysis and print results."""
     # Create instance of NonlinearDeltaCov
@@ -49,3 +73,45 @@ def perform_delta_method_analysis(results):
     # Wald test: checking that earnings are maximized after 15 years of work
     wald_test_result = delta_ratio.wald_test(np.array([15]))
     print("Wald Test Result: \n", wald_test_result, 2 * "\n")
+
+
+def perform_vectorized_analysis(results):
+    """Invert the Wald test over grids and run a joint test."""
+    delta = VectorizedDeltaMethod(
+        results.params,
+        results.cov_params(),
+        {"max_earn": max_earn, "decade_growth": decade_growth},
+        jacobians={"max_earn": max_earn_jacobian},
+    )
+
+    # Wald tests for 6001 values of experience in a single array operation
+    experience_grid = np.linspace(0, 60, 6001)
+    intervals = delta.confidence_intervals("max_earn", experience_grid)
+    print("Inverted Wald confidence set (grid step 0.01):\n", intervals)
+    print("Delta method confidence interval:\n", delta.conf_int("max_earn"))
+    print(
+        "Wald test at 15 years:\n",
+        delta.wald_test("max_earn", [15]),
+        2 * "\n",
+    )
+
+    # Joint confidence set for both transformations over a 2D grid
+    max_earn_values, growth_values = np.meshgrid(
+        np.linspace(0, 60, 301), np.linspace(0, 1, 201)
+    )
+    joint_set = delta.confidence_set(
+        ["max_earn", "decade_growth"],
+        np.column_stack([max_earn_values.ravel(), growth_values.ravel()]),
+    )
+    print(
+        "Joint 95% confidence set, range of each transformation:\n",
+        joint_set[["max_earn", "decade_growth"]].agg(["min", "max"]),
+        2 * "\n",
+    )
+
+    # Joint test: earnings peak after 15 years and grow 30% in the first decade
+    print(
+        "Joint Wald test:\n",
+        delta.wald_test(["max_earn", "decade_growth"], [15, 0.3]),
+        2 * "\n",
+    )
@@ -3,7 +3,25 @@ generate_data.py
 
 Functions for the data-generation process of the post.
 
+Besides the normal homoskedastic errors of the post, the residuals can be
+heavy-tailed (Student t, rescaled to variance resid_var) and
+heteroskedastic, with conditional variance proportional to
+1 + heteroskedasticity * (sum of squared non-constant covariates), normalized
+so that the unconditional variance stays resid_var.
+
 Functions:
+    - def generate_arrays(
+            num_observations: int,
+            betas: np.ndarray,
+            x_mean: np.ndarray,
+            x_covar: np.ndarray,
+            resid_var: np.ndarray,
+            seed: int = None,
+            errors: str = "normal",
+            t_df: float = 5.0,
+            heteroskedasticity: float = 0.0,
+        ) -> Tuple[np.ndarray, np.ndarray]:
+        Draws the outcome and covariates of the DGP as arrays.
     - def generate_data(
             num_observations: int,
             betas: np.ndarray,
@@ -11,6 +29,7 @@ Functions:
             x_covar: np.ndarray,
             resid_var: np.ndarray,
             seed: int = None,
+            **error_options,
         ) -> pd.DataFrame:
         Generates a synthetic dataset according to DGP of the post.
 """
@@ -18,39 +37,109 @@ Functions:
 import numpy as np
 import pandas as pd
 
+from typing import Tuple
 
-def generate_data(
+ERROR_DISTRIBUTIONS = ["normal", "t"]
+
+
+def generate_arrays(
     num_observations: int,
     betas: np.ndarray,
     x_mean: np.ndarray,
     x_covar: np.ndarray,
     resid_var: np.ndarray,
     seed: int = None,
-) -> pd.DataFrame:
-    """Generates a dataset with num_observations, normal covariates and shocks.
+    errors: str = "normal",
+    t_df: float = 5.0,
+    heteroskedasticity: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Draws the outcome and covariates of the DGP as arrays.
 
     Args:
         num_observations (int): number of observations.
         betas (np.ndarray): vector of coefficients.
         x_mean (np.ndarray): mean of covariates
         x_covar (np.ndarray): covariance matrix of covariates
-        resid_var (np.ndarray): variance of residual innovations
+        resid_var (np.ndarray): (unconditional) variance of residual
+            innovations
         seed (int, optional): random seed for reproducibility.
+        errors (str): distribution of the residuals, "normal" or "t".
+        t_df (float): degrees of freedom of t residuals (above 2).
+        heteroskedasticity (float): strength of heteroskedasticity, 0 for
+            homoskedastic residuals.
 
     Returns:
-        pd.DataFrame: _description_
+        Tuple[np.ndarray, np.ndarray]: outcome (num_observations,) and
+            covariates (num_observations, len(betas)).
+
+    Raises:
+        ValueError: if the error distribution is unknown or t_df <= 2.
     """
     # Initialize RNG
     rng = np.random.default_rng(seed)
 
-    # Draw covariates and residuals, combine into output
+    # Draw covariates and residuals
     covariates = rng.multivariate_normal(
         x_mean,
         x_covar,
         size=num_observations,
     )
-    resids = rng.normal(0, np.sqrt(resid_var), size=num_observations)
-    y = (covariates @ betas) + resids
+    if errors == "normal":
+        resids = rng.normal(0, np.sqrt(resid_var), size=num_observations)
+    elif errors == "t":
+        if t_df <= 2:
+            raise ValueError("t residuals need more than 2 degrees of freedom")
+        resids = rng.standard_t(t_df, size=num_observations) * np.sqrt(
+            resid_var * (t_df - 2) / t_df
+        )
+    else:
+        raise ValueError(f"Unknown error distribution: {errors}")
+
+    # Scale residuals by the skedastic function of the random covariates
+    if heteroskedasticity:
+        random_columns = np.diag(x_covar) > 0
+        x_squared = (covariates[:, random_columns] ** 2).sum(axis=1)
+        x_squared_mean = (np.diag(x_covar) + x_mean**2)[random_columns].sum()
+        resids *= np.sqrt(
+            (1 + heteroskedasticity * x_squared)
+            / (1 + heteroskedasticity * x_squared_mean)
+        )
+    return (covariates @ betas) + resids, covariates
+
+
+def generate_data(
+    num_observations: int,
+    betas: np.ndarray,
+    x_mean: np.ndarray,
+    x_covar: np.ndarray,
+    resid_var: np.ndarray,
+    seed: int = None,
+    **error_options,
+) -> pd.DataFrame:
+    """Generates a dataset with num_observations, normal covariates and shocks.
+
+    Args:
+        num_observations (int): number of observations.
+        betas (np.ndarray): vector of coefficients.
+        x_mean (np.ndarray): mean of covariates
+        x_covar (np.ndarray): covariance matrix of covariates
+        resid_var (np.ndarray): variance of residual innovations
+        seed (int, optional): random seed for reproducibility.
+        **error_options: errors, t_df and heteroskedasticity, see
+            generate_arrays.
+
+    Returns:
+        pd.DataFrame: outcome y and covariates X0, X1, ...
+    """
+    y, covariates = generate_arrays(
+        num_observations,
+        betas,
+        x_mean,
+        x_covar,
+        resid_var,
+        seed,
+        **error_options,
+    )
 
     # Convert output into pandas dataframes with dynamic variable names for X
     covariates_df = pd.DataFrame(
@@ -4,13 +4,36 @@ parameters.py
 This module contains the constants used for the simulation.
 
 Constants:
+- ADAPTIVE_INITIAL_POINTS (tuple): size of the coarse (c, rho) grid from which
+    the adaptive sweep starts.
+- ADAPTIVE_TOLERANCE (float): the adaptive sweep splits grid cells in which
+    power or power differences vary by more than this amount.
+- ANIMATION_DIR (str): directory of the per-frame data slices and the cache
+    of rendered frames of the power animation.
+- ANIMATION_FRAME_DURATION (float): seconds per frame of the power animation.
 - C_RANGE (np.array): range of values for coefficients on covariates
+- DISTRIBUTED_BLOCK_SIZE (int): number of replications per task in the
+    distributed mode.
+- DISTRIBUTED_CELLS_PER_TASK (int): number of (c, rho) cells per task in the
+    distributed mode.
+- DISTRIBUTED_LEASE_TIMEOUT (float): seconds after which tasks of
+    unresponsive workers are re-queued in the distributed mode.
+- EXECUTION_SPLIT_FILE (str): file with the processes x threads split
+    measured by `main.py --tune`.
 - NUM_OBSERVATIONS (int): number of observations in each sample.
 - NUM_REPLICATIONS (int): number of replications per seed.
 - OUTPUT_DIR (str): directory where the simulation results will be stored.
 - RHO_RANGE (np.array): range of correlations between covariates.
 - SEEDS (np.array): List of seeds for random number generation to
     ensure reproducibility.
+- SEQUENTIAL_BLOCK_SIZE (int): number of replications between stopping
+    checks in sequential mode.
+- SEQUENTIAL_MAX_REPLICATIONS (int): hard cap on replications per seed and
+    cell in sequential mode.
+- SEQUENTIAL_SE_TOLERANCE (float): target Monte Carlo standard error of the
+    rejection rates per seed and cell in sequential mode.
+- TUNING_CELLS (int): number of (c, rho) cells per seed timed for every
+    split by `main.py --tune`.
 """
 
 import numpy as np
@@ -24,5 +47,27 @@ SEEDS = np.linspace(1000, 16000, 16).astype(int)
 C_RANGE = np.linspace(-3, 3, 401)
 RHO_RANGE = np.linspace(-0.99, 0.99, 100)
 
+# Adaptive sweep parameters (C_RANGE x RHO_RANGE is the target resolution)
+ADAPTIVE_INITIAL_POINTS = (26, 12)
+ADAPTIVE_TOLERANCE = 0.05
+
+# Sequential stopping parameters
+SEQUENTIAL_BLOCK_SIZE = 25
+SEQUENTIAL_MAX_REPLICATIONS = 400
+SEQUENTIAL_SE_TOLERANCE = 0.025
+
+# Distributed execution parameters
+DISTRIBUTED_BLOCK_SIZE = 50
+DISTRIBUTED_CELLS_PER_TASK = 200
+DISTRIBUTED_LEASE_TIMEOUT = 600.0
+
+# Execution parameters
+EXECUTION_SPLIT_FILE = "simulation_results/execution_split.json"
+TUNING_CELLS = 20
+
 # Output directory
 OUTPUT_DIR = "simulation_results"
+
+# Animation parameters
+ANIMATION_DIR = "simulation_results/animation"
+ANIMATION_FRAME_DURATION = 0.1
@@ -13,7 +13,8 @@ Blog Post:
 Steps:
 ------
 1. Load parameters and set up simulation configurations.
-2. Run Monte Carlo simulations in parallel for multiple sample sizes.
+2. Run Monte Carlo simulations in parallel for multiple sample sizes, with
+   live progress, throughput and ETA printed to stderr.
 3. Save and combine simulation results into a single output file.
 
 Outputs:
@@ -27,44 +28,404 @@ Run the script using:
 or
     python main.py
 
+To simulate only the informative part of the (c, rho) grid, run
+    python main.py --mode adaptive
+To stop each cell once its rejection rates are precise enough, add
+    --sequential
+To compute the power surface without simulation (and check existing
+simulation results against it), run
+    python main.py --mode analytic
+To run the sweep through a task queue on a shared filesystem, with workers
+on several machines (each started with `python -m utils.task_queue DIR`
+from this folder), run
+    python main.py --mode distributed --queue-dir DIR [--local-workers N]
+Heteroskedastic or heavy-tailed variants of the DGP and robust tests are
+selected with --errors, --heteroskedasticity and --cov-type, e.g.
+    python main.py --errors t --heteroskedasticity 1 --cov-type HC3
+By default, one worker process runs per seed (at most one per core), and the
+BLAS/OpenMP thread pools of every worker are pinned to its share of the
+cores to avoid oversubscription. The split can be set with
+    --processes P --threads T
+where --kernel-threads runs the batched tests of every process on its T
+threads instead of BLAS. The fastest split can be measured on a sample of
+the grid (and saved for later runs) with
+    python main.py --tune
+To submit to a warm worker pool that stays alive between runs, start
+    python -m utils.worker_pool
+once and add
+    --pool
+
+Heavy libraries are imported after parsing the arguments, so --help returns
+immediately.
 """
 
 
+import argparse
 import os
 
-from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 
 from data_generation.parameters import (
+    ADAPTIVE_INITIAL_POINTS,
+    ADAPTIVE_TOLERANCE,
     C_RANGE,
+    DISTRIBUTED_BLOCK_SIZE,
+    DISTRIBUTED_CELLS_PER_TASK,
+    DISTRIBUTED_LEASE_TIMEOUT,
+    EXECUTION_SPLIT_FILE,
     NUM_OBSERVATIONS,
     NUM_REPLICATIONS,
     OUTPUT_DIR,
     RHO_RANGE,
     SEEDS,
+    SEQUENTIAL_BLOCK_SIZE,
+    SEQUENTIAL_MAX_REPLICATIONS,
+    SEQUENTIAL_SE_TOLERANCE,
+    TUNING_CELLS,
 )
-from simulation.run_simulation import run_simulation_for_seed
-from utils.combine_results import combine_results
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+def parse_args() -> argparse.Namespace:
+    """Parses command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Power of the Wald test vs. adjusted multiple t-tests."
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["grid", "adaptive", "analytic", "distributed"],
+        default="grid",
+        help=(
+            "grid: simulate every point of C_RANGE x RHO_RANGE; "
+            "adaptive: refine a coarse grid where power changes the most; "
+            "analytic: compute power by numerical integration; "
+            "distributed: run the grid through a task queue in --queue-dir"
+        ),
+    )
+    parser.add_argument(
+        "--queue-dir",
+        default="simulation_queue",
+        help="queue folder on a filesystem shared by all worker nodes",
+    )
+    parser.add_argument(
+        "--local-workers",
+        type=int,
+        default=0,
+        help="number of queue workers to start on this machine",
+    )
+    parser.add_argument(
+        "--sequential",
+        action="store_true",
+        help=(
+            "run replications in blocks and stop each cell once the standard "
+            "error of every rejection rate is below SEQUENTIAL_SE_TOLERANCE "
+            "(at most SEQUENTIAL_MAX_REPLICATIONS)"
+        ),
+    )
+    parser.add_argument(
+        "--pool",
+        action="store_true",
+        help=(
+            "submit to the warm worker pool started with "
+            "`python -m utils.worker_pool` instead of starting new workers"
+        ),
+    )
+    parser.add_argument(
+        "--errors",
+        choices=["normal", "t"],
+        default="normal",
+        help="distribution of the regression errors",
+    )
+    parser.add_argument(
+        "--t-df",
+        type=float,
+        default=5.0,
+        help="degrees of freedom of t errors",
+    )
+    parser.add_argument(
+        "--heteroskedasticity",
+        type=float,
+        default=0.0,
+        help=(
+            "strength of heteroskedasticity: error variance proportional to "
+            "1 + value * (X1^2 + X2^2)"
+        ),
+    )
+    parser.add_argument(
+        "--cov-type",
+        choices=["nonrobust", "HC0", "HC1", "HC2", "HC3"],
+        default="nonrobust",
+        help="covariance matrix used by the tests",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["batched", "statsmodels"],
+        default="batched",
+        help=(
+            "batched: test blocks of replications with stacked numpy "
+            "operations; statsmodels: fit every replication (reference)"
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per seed, at most one per core)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help=(
+            "threads per worker process (default: the remaining cores "
+            "divided among the processes)"
+        ),
+    )
+    parser.add_argument(
+        "--kernel-threads",
+        action="store_true",
+        help=(
+            "run the batched tests of every process on its threads, with "
+            "single-threaded BLAS, instead of giving the threads to BLAS"
+        ),
+    )
+    parser.add_argument(
+        "--tune",
+        action="store_true",
+        help=(
+            "measure the fastest processes x threads split on a sample of the "
+            "grid, save it to EXECUTION_SPLIT_FILE for later runs, and exit"
+        ),
+    )
+    args = parser.parse_args()
+    if args.pool and (
+        args.processes or args.threads or args.kernel_threads or args.tune
+    ):
+        parser.error(
+            "--pool uses the split of the pool daemon (see its --workers/--threads)"
+        )
+    if args.mode == "analytic" and simulation_options(args):
+        parser.error("--mode analytic only covers the DGP and tests of the post")
+    if args.mode == "distributed" and (args.sequential or args.pool):
+        parser.error("--mode distributed does not support --sequential/--pool")
+    return args
+
+
+def simulation_options(args: argparse.Namespace) -> Optional[Dict[str, Any]]:
+    """Options of run_simulation_for_cells that differ from the post, if any"""
+    options = {}
+    if args.errors != "normal":
+        options.update(errors=args.errors, t_df=args.t_df)
+    if args.heteroskedasticity:
+        options["heteroskedasticity"] = args.heteroskedasticity
+    if args.cov_type != "nonrobust":
+        options["cov_type"] = args.cov_type
+    if args.engine != "batched":
+        options["engine"] = args.engine
+    return options or None
+
+
+def execution_split(args: argparse.Namespace) -> Tuple[int, int, bool]:
+    """Number of worker processes, threads per process and whether the
+    threads run the batched tests: as given on the command line, else as
+    tuned with --tune on this machine, else planned from the number of seeds
+    and cores"""
+    from utils.execution import load_split, plan_split
+
+    if args.processes is None and args.threads is None and not args.kernel_threads:
+        tuned = load_split(EXECUTION_SPLIT_FILE)
+        if tuned is not None:
+            return tuned
+    return (
+        *plan_split(args.processes, args.threads, len(SEEDS)),
+        args.kernel_threads,
+    )
+
+
+def run_tuning(options: Optional[Dict[str, Any]]) -> None:
+    """Times a sample of the grid for every processes x threads split, with
+    the threads given to BLAS and to the batched tests, and saves the
+    fastest split. Every worker first tests a single replication, so that
+    imports are not timed"""
+    from itertools import product
+
+    from simulation.run_simulation import run_simulation_for_cells
+    from utils.execution import candidate_splits, save_split, tune_split
+
+    # Cells spread evenly over the grid, one task per seed as in grid mode
+    all_cells = list(product(C_RANGE, RHO_RANGE))
+    cells = all_cells[:: max(1, len(all_cells) // TUNING_CELLS)]
+    tasks = [
+        (
+            seed,
+            NUM_REPLICATIONS,
+            NUM_OBSERVATIONS,
+            cells,
+            None,
+            None,
+            SEQUENTIAL_BLOCK_SIZE,
+            0,
+            options,
+        )
+        for seed in SEEDS
+    ]
+    best = {}
+    for kernel_threads in (False, True):
+        # With a single thread per process, both modes are the same
+        candidates = [
+            split for split in candidate_splits() if split[1] > 1 or not kernel_threads
+        ]
+        if not candidates:
+            continue
+        print("Threads run " + ("the batched tests:" if kernel_threads else "BLAS:"))
+        split, timings = tune_split(
+            run_simulation_for_cells,
+            tasks,
+            candidates,
+            kernel_threads,
+            warmup_task=(
+                SEEDS[0], 1, NUM_OBSERVATIONS, cells[:1], None, None,
+                SEQUENTIAL_BLOCK_SIZE, 0, options,
+            ),
+        )
+        best[kernel_threads] = (timings[split], split)
+    kernel_threads = min(best, key=lambda mode: best[mode][0])
+    split = best[kernel_threads][1]
+    save_split(EXECUTION_SPLIT_FILE, split, kernel_threads)
+    print(
+        f"Fastest split: {split[0]} processes x {split[1]} threads"
+        f"{' (batched tests)' if kernel_threads else ''}, saved to "
+        f"{EXECUTION_SPLIT_FILE}"
+    )
+
+
+def run_analytic() -> None:
+    """Computes the power surface without simulation and compares it with
+    the combined simulation results, if they exist"""
+    import pandas as pd
+
+    from simulation.analytic_power import (
+        compare_with_simulation,
+        compute_power_surface,
+    )
+
+    analytic = compute_power_surface(C_RANGE, RHO_RANGE, NUM_OBSERVATIONS)
+    analytic.to_csv(Path(OUTPUT_DIR) / "analytic_power.csv", index=False)
+    print("Analytic power surface saved to analytic_power.csv")
+
+    combined_file = Path(OUTPUT_DIR) / "combined_results.csv"
+    if combined_file.exists():
+        comparison = compare_with_simulation(pd.read_csv(combined_file), analytic)
+        print(
+            "Simulated vs. analytic power, share of |z| > 3 by test:\n",
+            (comparison["z_score"].abs() > 3).groupby(comparison["test"]).mean(),
+        )
 
 
 # Run simulations in parallel
 def main():
     """Main function to run the simulation and combine results"""
-    with ProcessPoolExecutor() as executor:
-        [
+    args = parse_args()
+
+    # Ensure output directory exists
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    if args.mode == "analytic":
+        run_analytic()
+        return
+    if args.tune:
+        run_tuning(simulation_options(args))
+        return
+
+    from simulation.adaptive_grid import run_adaptive_simulation
+    from simulation.distributed import run_distributed_simulation
+    from simulation.run_simulation import run_simulation_for_seed
+    from utils.combine_results import combine_results
+    from utils.progress import ProgressTracker
+    from utils.worker_pool import WarmPoolClient, create_executor
+
+    options = simulation_options(args)
+    if args.sequential:
+        num_replications = SEQUENTIAL_MAX_REPLICATIONS
+        se_tolerance = SEQUENTIAL_SE_TOLERANCE
+    else:
+        num_replications = NUM_REPLICATIONS
+        se_tolerance = None
+
+    if args.mode == "distributed":
+        total = len(SEEDS) * len(C_RANGE) * len(RHO_RANGE) * num_replications
+        with ProgressTracker(total) as progress:
+            run_distributed_simulation(
+                SEEDS,
+                num_replications,
+                NUM_OBSERVATIONS,
+                C_RANGE,
+                RHO_RANGE,
+                OUTPUT_DIR,
+                args.queue_dir,
+                DISTRIBUTED_CELLS_PER_TASK,
+                DISTRIBUTED_BLOCK_SIZE,
+                DISTRIBUTED_LEASE_TIMEOUT,
+                args.local_workers,
+                progress.reporter("queue"),
+                options,
+            )
+        combine_results(OUTPUT_DIR, SEEDS)
+        print("All results combined and saved to combined_results.csv")
+        return
+
+    # The pool client must exist before the progress tracker, see
+    # WarmPoolClient
+    if args.pool:
+        executor = WarmPoolClient()
+    else:
+        num_processes, num_threads, kernel_threads = execution_split(args)
+        executor = create_executor(
+            num_processes,
+            threads_per_worker=num_threads,
+            kernel_threads=kernel_threads,
+        )
+
+    if args.mode == "adaptive":
+        with executor, ProgressTracker(0) as progress:
+            run_adaptive_simulation(
+                SEEDS,
+                num_replications,
+                NUM_OBSERVATIONS,
+                C_RANGE,
+                RHO_RANGE,
+                OUTPUT_DIR,
+                executor,
+                ADAPTIVE_INITIAL_POINTS,
+                ADAPTIVE_TOLERANCE,
+                progress,
+                se_tolerance,
+                SEQUENTIAL_BLOCK_SIZE,
+                options,
+            )
+        combine_results(OUTPUT_DIR, SEEDS)
+        print("All results combined and saved to combined_results.csv")
+        return
+
+    total = len(SEEDS) * len(C_RANGE) * len(RHO_RANGE) * num_replications
+    with executor, ProgressTracker(total) as progress:
+        futures = {
             executor.submit(
                 run_simulation_for_seed,
                 seed,
-                NUM_REPLICATIONS,
+                num_replications,
                 NUM_OBSERVATIONS,
                 C_RANGE,
                 RHO_RANGE,
                 OUTPUT_DIR,
-            )
+                progress.reporter(seed),
+                se_tolerance,
+                SEQUENTIAL_BLOCK_SIZE,
+                options,
+            ): seed
             for seed in SEEDS
-        ]
+        }
+        progress.wait(futures)
 
     # Combine results
     combine_results(OUTPUT_DIR, SEEDS)
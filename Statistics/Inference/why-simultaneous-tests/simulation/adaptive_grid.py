@@ -0,0 +1,230 @@
+"""
+adaptive_grid.py
+
+Adaptive sweep over the (c, rho) grid. Instead of simulating every point of
+C_RANGE × RHO_RANGE, the sweep starts from a coarse subgrid and recursively
+splits the grid cells in which the power surfaces change the most. The full
+grid is the target resolution: a cell is never split below one grid step.
+
+A cell is split if, across its four corners, the power of any test (Wald,
+Bonferroni, Holm-Sidak) or the power difference between Wald and one of the
+multiple tests varies by more than a tolerance. Flat regions where power is
+close to 0 or 1 are therefore only simulated on the coarse grid.
+
+The output schema matches run_simulation_for_seed: one
+`results_seed_{seed}.csv` per seed, with one row per simulated point and
+replication, so combine_results and the plotting code work unchanged.
+
+Functions:
+    - initial_indices(size: int, num_points: int) -> np.ndarray:
+        Coarse subgrid of indices into a range of the given size.
+    - cell_score(power: Dict[Tuple[int, int], np.ndarray],
+            cell: Tuple[int, int, int, int]) -> float:
+        Largest variation of the power surfaces over the corners of a cell.
+    - split_cell(cell: Tuple[int, int, int, int])
+            -> List[Tuple[int, int, int, int]]:
+        Splits a cell at its midpoints along the axes that can be split.
+    - run_adaptive_simulation(
+            seeds: list[int],
+            num_replications: int,
+            num_observations: int,
+            c_range: np.array,
+            rho_range: np.array,
+            output_dir: str,
+            executor: Executor,
+            initial_points: Tuple[int, int],
+            tolerance: float,
+            progress: Optional[ProgressTracker] = None,
+            se_tolerance: Optional[float] = None,
+            block_size: int = 50,
+            options: Optional[Dict[str, Any]] = None,
+        ) -> int:
+        Runs the adaptive sweep and saves results per seed.
+"""
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import Executor
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from simulation.run_simulation import TESTS, run_simulation_for_cells
+from utils.progress import ProgressTracker
+
+# Cells are stored as (i0, i1, j0, j1): indices of the corners in c_range
+# (i) and rho_range (j)
+Cell = Tuple[int, int, int, int]
+
+
+def initial_indices(size: int, num_points: int) -> np.ndarray:
+    """Coarse subgrid of indices into a range, always including both ends.
+
+    Args:
+        size (int): number of points in the full range.
+        num_points (int): number of points in the coarse subgrid.
+
+    Returns:
+        np.ndarray: sorted unique indices.
+    """
+    num_points = min(max(num_points, 2), size)
+    return np.unique(np.round(np.linspace(0, size - 1, num_points)).astype(int))
+
+
+def cell_score(power: Dict[Tuple[int, int], np.ndarray], cell: Cell) -> float:
+    """Largest variation of the power surfaces over the corners of a cell.
+
+    Args:
+        power (Dict[Tuple[int, int], np.ndarray]): estimated power of the
+            tests in TESTS order, by grid point.
+        cell (Cell): cell to score.
+
+    Returns:
+        float: maximal range over the corners of the power of each test and
+            of the power differences Wald - Bonferroni, Wald - Holm-Sidak.
+    """
+    i0, i1, j0, j1 = cell
+    corners = np.array([power[(i, j)] for i in (i0, i1) for j in (j0, j1)])
+    surfaces = np.column_stack(
+        [corners, corners[:, [0]] - corners[:, 1:]]
+    )
+    return float(np.max(surfaces.max(axis=0) - surfaces.min(axis=0)))
+
+
+def split_cell(cell: Cell) -> List[Cell]:
+    """Splits a cell at its midpoints along the axes that can be split.
+
+    Args:
+        cell (Cell): cell to split.
+
+    Returns:
+        List[Cell]: two or four child cells, or an empty list if the cell is
+            already at the resolution of the full grid.
+    """
+    i0, i1, j0, j1 = cell
+    i_edges = [i0, (i0 + i1) // 2, i1] if i1 - i0 > 1 else [i0, i1]
+    j_edges = [j0, (j0 + j1) // 2, j1] if j1 - j0 > 1 else [j0, j1]
+    if len(i_edges) == 2 and len(j_edges) == 2:
+        return []
+    return [
+        (i_edges[a], i_edges[a + 1], j_edges[b], j_edges[b + 1])
+        for a in range(len(i_edges) - 1)
+        for b in range(len(j_edges) - 1)
+    ]
+
+
+def run_adaptive_simulation(
+    seeds: list[int],
+    num_replications: int,
+    num_observations: int,
+    c_range: np.array,
+    rho_range: np.array,
+    output_dir: str,
+    executor: Executor,
+    initial_points: Tuple[int, int],
+    tolerance: float,
+    progress: Optional[ProgressTracker] = None,
+    se_tolerance: Optional[float] = None,
+    block_size: int = 50,
+    options: Optional[Dict[str, Any]] = None,
+) -> int:
+    """Runs the adaptive sweep over (c, rho) and saves results as CSV.
+
+    Every refinement round submits one task per seed with the new grid
+    points, so all seeds share the same set of simulated points.
+
+    Args:
+        seeds (list[int]): random seeds, one task per seed and round.
+        num_replications (int): number of replications per seed.
+        num_observations (int): number of observations in each sample
+        c_range (np.array): full (target) range of coefficients.
+        rho_range (np.array): full (target) range of correlations.
+        output_dir (str): directory to save the output CSVs.
+        executor (Executor): executor to submit the tasks to.
+        initial_points (Tuple[int, int]): size of the coarse grid in the c
+            and rho dimensions.
+        tolerance (float): cells whose score exceeds the tolerance are split.
+        progress (ProgressTracker, optional): tracker for live progress.
+        se_tolerance (float, optional): target standard error for sequential
+            stopping, see run_simulation_for_cells.
+        block_size (int): number of replications between stopping checks.
+        options (Dict[str, Any], optional): variant of the DGP and tests,
+            see run_simulation_for_cells.
+
+    Returns:
+        int: number of simulated grid points.
+    """
+    results = {seed: [] for seed in seeds}
+    power = {}
+
+    i_coarse = initial_indices(len(c_range), initial_points[0])
+    j_coarse = initial_indices(len(rho_range), initial_points[1])
+    cells = [
+        (i_coarse[a], i_coarse[a + 1], j_coarse[b], j_coarse[b + 1])
+        for a in range(len(i_coarse) - 1)
+        for b in range(len(j_coarse) - 1)
+    ]
+    new_points = sorted(set(product(i_coarse, j_coarse)))
+
+    while new_points:
+        # Simulate the new points for all seeds
+        point_values = [(c_range[i], rho_range[j]) for i, j in new_points]
+        if progress is not None:
+            progress.extend(len(seeds) * len(new_points) * num_replications)
+        futures = {
+            executor.submit(
+                run_simulation_for_cells,
+                seed,
+                num_replications,
+                num_observations,
+                point_values,
+                None if progress is None else progress.reporter(seed),
+                se_tolerance,
+                block_size,
+                options=options,
+            ): seed
+            for seed in seeds
+        }
+        if progress is not None:
+            progress.wait(futures)
+        round_results = []
+        for future, seed in futures.items():
+            results[seed].extend(future.result())
+            round_results.extend(future.result())
+
+        # Estimate power at the new points, pooling all seeds
+        round_power = (
+            pd.DataFrame(round_results, columns=["c", "rho"] + TESTS)
+            .groupby(["c", "rho"])[TESTS]
+            .mean()
+            .reindex([(c_range[i], rho_range[j]) for i, j in new_points])
+            .to_numpy(dtype=float)
+        )
+        power.update(zip(new_points, round_power))
+
+        # Split the cells where the power surfaces change the most
+        children = [
+            child
+            for cell in cells
+            if cell_score(power, cell) > tolerance
+            for child in split_cell(cell)
+        ]
+        cells = children
+        new_points = sorted(
+            {
+                (i, j)
+                for i0, i1, j0, j1 in children
+                for i, j in product((i0, i1), (j0, j1))
+            } - power.keys()
+        )
+
+    # Save results to CSV
+    for seed, seed_results in results.items():
+        output_file = Path(output_dir) / f"results_seed_{seed}.csv"
+        pd.DataFrame(seed_results).to_csv(output_file, index=False)
+    print(
+        f"Adaptive sweep simulated {len(power)} of "
+        f"{len(c_range) * len(rho_range)} grid points"
+    )
+    return len(power)
@@ -0,0 +1,234 @@
+"""
+analytic_power.py
+
+Computes the power of the Wald test and of the adjusted multiple t-tests
+without simulation, using the Gaussian structure of the DGP.
+
+In the DGP of the post, y = 1 + c X1 + c X2 + u with (X1, X2) bivariate
+normal with unit variances and correlation rho, and u standard normal.
+Conditionally on the covariates:
+- The Wald statistic divided by 2 follows a noncentral F(2, n - 3)
+  distribution with noncentrality c^2 (2 + 2 rho) Q, where Q ~ chi2(n - 1)
+  is the scaled sample variance of X1 + X2. Averaging over Q with quadrature
+  gives the exact power of the Wald test.
+- The two t-statistics are (Z1, Z2) / sqrt(s), where (Z1, Z2) is bivariate
+  normal with correlation -rho and s ~ chi2(n - 3) / (n - 3). Bonferroni and
+  Holm-Sidak reject (at least one hypothesis) iff max |t_k| exceeds a
+  critical value, so power is one minus a rectangle probability, computed by
+  Gauss-Legendre integration over Z1 and quadrature over s. The design
+  matrix is replaced by its expectation, which introduces an O(1/n) error.
+
+The whole (c, rho) surface of the post takes a few seconds. The functions
+also serve as an oracle for the Monte Carlo in run_simulation_for_seed, see
+compare_with_simulation.
+
+Functions:
+    - chi2_quadrature(df: int, num_nodes: int)
+            -> Tuple[np.ndarray, np.ndarray]:
+        Quadrature nodes and weights for a chi2(df) / df variable.
+    - wald_power(c: np.ndarray, rho: np.ndarray, num_observations: int,
+            alpha: float = 0.05) -> np.ndarray:
+        Power of the Wald test.
+    - multiple_t_power(c: np.ndarray, rho: np.ndarray, num_observations: int,
+            method: str, alpha: float = 0.05) -> np.ndarray:
+        Power of the Bonferroni or Holm-Sidak adjusted t-tests.
+    - compute_power_surface(c_range: np.array, rho_range: np.array,
+            num_observations: int, alpha: float = 0.05) -> pd.DataFrame:
+        Power of all tests on a (c, rho) grid.
+    - compare_with_simulation(results: pd.DataFrame,
+            analytic: pd.DataFrame) -> pd.DataFrame:
+        Standardized differences between simulated and analytic power.
+"""
+
+import numpy as np
+import pandas as pd
+
+from scipy import stats
+from scipy.special import ndtr
+from typing import Tuple
+
+from simulation.run_simulation import TESTS
+
+# Quadrature sizes: nodes for chi2 variables and Gauss-Legendre nodes for
+# bivariate normal rectangle probabilities
+NUM_CHI2_NODES = 12
+NUM_LEGENDRE_NODES = 32
+
+
+def chi2_quadrature(
+    df: int,
+    num_nodes: int = NUM_CHI2_NODES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Quadrature nodes and weights for a chi2(df) / df variable.
+
+    Writes the variable as a smooth transformation F^{-1}(Phi(Z)) of a
+    standard normal Z and applies Gauss-Hermite quadrature in Z.
+
+    Args:
+        df (int): degrees of freedom.
+        num_nodes (int): number of nodes.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: nodes and weights (summing to one).
+    """
+    z, weights = np.polynomial.hermite_e.hermegauss(num_nodes)
+    return stats.chi2.isf(ndtr(-z), df) / df, weights / weights.sum()
+
+
+def wald_power(
+    c: np.ndarray,
+    rho: np.ndarray,
+    num_observations: int,
+    alpha: float = 0.05,
+) -> np.ndarray:
+    """Power of the chi2 Wald test of H0: beta_1 = beta_2 = 0.
+
+    Args:
+        c (np.ndarray): coefficients on the covariates.
+        rho (np.ndarray): correlations between covariates (broadcast with c).
+        num_observations (int): number of observations in each sample.
+        alpha (float): significance level.
+
+    Returns:
+        np.ndarray: rejection probabilities.
+    """
+    c, rho = np.broadcast_arrays(np.asarray(c, float), np.asarray(rho, float))
+    df_resid = num_observations - 3
+    critical_value = stats.chi2.ppf(1 - alpha, 2) / 2
+
+    # Scaled sample variance of X1 + X2 at the quadrature nodes
+    q, weights = chi2_quadrature(num_observations - 1)
+    noncentrality = (c**2 * (2 + 2 * rho))[..., None] * q * (num_observations - 1)
+
+    # scipy's ncf is not reliable at zero noncentrality, use the central F
+    power = np.where(
+        noncentrality > 0,
+        stats.ncf.sf(critical_value, 2, df_resid, noncentrality),
+        stats.f.sf(critical_value, 2, df_resid),
+    )
+    return power @ weights
+
+
+def _critical_t(num_observations: int, method: str, alpha: float) -> float:
+    """Critical value for max |t_k| such that at least one test rejects."""
+    if method == "bonferroni":
+        level = alpha / 2
+    elif method == "hs":
+        level = 1 - (1 - alpha) ** (1 / 2)
+    else:
+        raise ValueError(f"Unknown multiple testing method: {method}")
+    return stats.t.ppf(1 - level / 2, num_observations - 3)
+
+
+def multiple_t_power(
+    c: np.ndarray,
+    rho: np.ndarray,
+    num_observations: int,
+    method: str,
+    alpha: float = 0.05,
+) -> np.ndarray:
+    """Power of the adjusted multiple t-tests (at least one rejection).
+
+    Args:
+        c (np.ndarray): coefficients on the covariates.
+        rho (np.ndarray): correlations between covariates (broadcast with c).
+        num_observations (int): number of observations in each sample.
+        method (str): "bonferroni" or "hs" (Holm-Sidak), as in multipletests.
+        alpha (float): familywise significance level.
+
+    Returns:
+        np.ndarray: rejection probabilities.
+    """
+    c, rho = np.broadcast_arrays(np.asarray(c, float), np.asarray(rho, float))
+    shape = c.shape
+    c, rho = c.ravel(), rho.ravel()
+
+    # Means and correlation of the standardized coefficient estimates
+    delta = c * np.sqrt((num_observations - 1) * (1 - rho**2))
+    corr = -rho
+    scale = np.sqrt(1 - corr**2)
+
+    # Critical values at the nodes of sigma_hat / sigma
+    s, s_weights = chi2_quadrature(num_observations - 3)
+    bound = _critical_t(num_observations, method, alpha) * np.sqrt(s)
+    nodes, weights = np.polynomial.legendre.leggauss(NUM_LEGENDRE_NODES)
+
+    # P(|Z1| <= b, |Z2| <= b): integrate over u = Z1 - delta on
+    # [-b - delta, b - delta]. Arrays are (points, chi2 nodes, GL nodes).
+    lower = -bound[None, :] - delta[:, None]
+    upper = bound[None, :] - delta[:, None]
+    half_width = (upper - lower)[..., None] / 2
+    u = (lower + upper)[..., None] / 2 + half_width * nodes
+    shift = corr[:, None, None] * u + delta[:, None, None]
+    inner = (
+        ndtr((bound[None, :, None] - shift) / scale[:, None, None])
+        - ndtr((-bound[None, :, None] - shift) / scale[:, None, None])
+    )
+    density = np.exp(-u**2 / 2) / np.sqrt(2 * np.pi)
+    acceptance = (half_width * density * inner) @ weights
+    return (1 - acceptance @ s_weights).clip(0, 1).reshape(shape)
+
+
+def compute_power_surface(
+    c_range: np.array,
+    rho_range: np.array,
+    num_observations: int,
+    alpha: float = 0.05,
+) -> pd.DataFrame:
+    """Power of all tests on the (c, rho) grid.
+
+    Args:
+        c_range (np.array): range of values for coefficients on covariates
+        rho_range (np.array): range of correlations between covariates
+        num_observations (int): number of observations in each sample
+        alpha (float): significance level.
+
+    Returns:
+        pd.DataFrame: columns c, rho and the power of each test in TESTS,
+            one row per grid point.
+    """
+    c_grid, rho_grid = np.meshgrid(c_range, rho_range, indexing="ij")
+    power = {"c": c_grid.ravel(), "rho": rho_grid.ravel()}
+    power["Wald"] = np.concatenate(
+        [wald_power(c, rho_range, num_observations, alpha) for c in c_range]
+    )
+    for test, method in [("Bonferroni", "bonferroni"), ("Holm-Sidak", "hs")]:
+        power[test] = np.concatenate([
+            multiple_t_power(c, rho_range, num_observations, method, alpha)
+            for c in c_range
+        ])
+    return pd.DataFrame(power)
+
+
+def compare_with_simulation(
+    results: pd.DataFrame,
+    analytic: pd.DataFrame,
+) -> pd.DataFrame:
+    """Standardized differences between simulated and analytic power.
+
+    Args:
+        results (pd.DataFrame): simulation results (e.g. the combined
+            results), one row per replication.
+        analytic (pd.DataFrame): output of compute_power_surface.
+
+    Returns:
+        pd.DataFrame: for each simulated (c, rho) and test, the simulated
+            power, the analytic power and the z-score of their difference
+            based on the binomial Monte Carlo standard error.
+    """
+    simulated = results.groupby(["c", "rho"])[TESTS].agg(["mean", "count"])
+    rows = []
+    for test in TESTS:
+        merged = (
+            simulated[test]
+            .reset_index()
+            .merge(analytic[["c", "rho", test]], on=["c", "rho"])
+            .rename(columns={"mean": "simulated", test: "analytic"})
+        )
+        p = merged["analytic"].clip(1e-6, 1 - 1e-6)
+        merged["z_score"] = (merged["simulated"] - merged["analytic"]) / np.sqrt(
+            p * (1 - p) / merged["count"]
+        )
+        merged["test"] = test
+        rows.append(merged)
+    return pd.concat(rows, ignore_index=True)
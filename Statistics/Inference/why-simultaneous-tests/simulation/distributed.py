@@ -0,0 +1,129 @@
+"""
+distributed.py
+
+Runs the full (c, rho) sweep through the file-based task queue of
+utils.task_queue, so that workers on several machines sharing a filesystem
+can contribute.
+
+The sweep is split into tasks of (seed, chunk of cells, block of
+replications). Task ids include a hash of the task arguments and code (see
+utils.task_queue.make_task_id), so rerunning the coordinator on the same
+queue folder only publishes the tasks without a committed result, and runs
+with other settings (e.g. sample size or grid) never reuse stale results.
+Once all tasks are done, the results are assembled into the usual
+`results_seed_{seed}.csv` files.
+
+Functions:
+    - run_distributed_simulation(
+            seeds: list[int],
+            num_replications: int,
+            num_observations: int,
+            c_range: np.array,
+            rho_range: np.array,
+            output_dir: str,
+            queue_dir: str,
+            cells_per_task: int,
+            block_size: int,
+            lease_timeout: float,
+            num_local_workers: int = 0,
+            progress: Optional[ProgressReporter] = None,
+            options: Optional[Dict[str, Any]] = None,
+        ) -> None
+        Publishes the sweep, waits for the workers and saves the results.
+"""
+
+import numpy as np
+import pandas as pd
+
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from simulation.run_simulation import run_simulation_for_cells
+from utils.progress import ProgressReporter
+from utils.task_queue import FileTaskQueue, make_task_id, start_local_workers
+
+
+def run_distributed_simulation(
+    seeds: list[int],
+    num_replications: int,
+    num_observations: int,
+    c_range: np.array,
+    rho_range: np.array,
+    output_dir: str,
+    queue_dir: str,
+    cells_per_task: int,
+    block_size: int,
+    lease_timeout: float,
+    num_local_workers: int = 0,
+    progress: Optional[ProgressReporter] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Runs the (c, rho) sweep through a task queue and saves as CSV.
+
+    Args:
+        seeds (list[int]): random seeds.
+        num_replications (int): number of replications per seed.
+        num_observations (int): number of observations in each sample
+        c_range (np.array): range of values for coefficients on covariates
+        rho_range (np.array): range of correlations between covariates
+        output_dir (str): directory to save the output CSVs.
+        queue_dir (str): root folder of the queue, on a filesystem shared by
+            all nodes.
+        cells_per_task (int): number of (c, rho) cells per task.
+        block_size (int): number of replications per task.
+        lease_timeout (float): seconds after which tasks of unresponsive
+            workers are re-queued. Must match the workers.
+        num_local_workers (int): number of worker processes to start on this
+            machine in addition to workers on other nodes. Defaults to 0.
+        progress (ProgressReporter, optional): reporter advanced as tasks
+            finish.
+        options (Dict[str, Any], optional): variant of the DGP and tests,
+            see run_simulation_for_cells. Task ids include a hash of all
+            task arguments, so variants can share a queue folder.
+    """
+    queue = FileTaskQueue(queue_dir, lease_timeout)
+    queue.reopen()
+
+    # Publish tasks of (seed, chunk of cells, block of replications)
+    cells = list(product(c_range, rho_range))
+    task_sizes = {}
+    for seed in seeds:
+        for first_cell in range(0, len(cells), cells_per_task):
+            chunk = cells[first_cell:first_cell + cells_per_task]
+            for first_rep in range(0, num_replications, block_size):
+                num_block = min(block_size, num_replications - first_rep)
+                task_args = (seed, num_block, num_observations, chunk)
+                task_kwargs = {"first_replication": first_rep, "options": options}
+                task_id = make_task_id(
+                    f"seed{seed}_cell{first_cell:06d}_rep{first_rep:06d}",
+                    run_simulation_for_cells,
+                    *task_args,
+                    **task_kwargs,
+                )
+                task_sizes[task_id] = len(chunk) * num_block
+                queue.publish(
+                    task_id, run_simulation_for_cells, *task_args, **task_kwargs
+                )
+    queue.close()
+
+    workers = start_local_workers(queue_dir, num_local_workers, lease_timeout)
+    results = queue.wait(task_sizes, progress)
+    for worker in workers:
+        worker.join()
+
+    # Assemble results in the order of the full sweep
+    cell_index = {cell: index for index, cell in enumerate(cells)}
+    for seed in seeds:
+        seed_results = [
+            row
+            for task_id, task_results in results.items()
+            if task_id.startswith(f"seed{seed}_")
+            for row in task_results
+        ]
+        seed_results.sort(
+            key=lambda row: (cell_index[(row["c"], row["rho"])], row["replication"])
+        )
+        output_file = Path(output_dir) / f"results_seed_{seed}.csv"
+        pd.DataFrame(seed_results).to_csv(output_file, index=False)
+        print(f"Results saved to {output_file}")
@@ -2,9 +2,28 @@
 run_simulation.py
 
 This module contains functions to run Monte Carlo simulations for different
-seeds and save the results to CSV files.
+seeds and save the results to CSV files. Replications are tested in blocks
+with the batched engine of simulation.batched_tests; the statsmodels
+reference engine is imported only when selected. Blocks are split over the
+kernel threads of the process, if any (see utils.execution). If testing a
+block fails (e.g. because of a singular sample), its samples are tested one
+by one, so that only the failing replications are dropped.
 
 Functions:
+    - max_rejection_rate_se(cell_results: list[dict]) -> float
+        Largest Monte Carlo standard error of the rejection rates in a cell
+    - run_simulation_for_cells(
+            seed: int,
+            num_replications: int,
+            num_observations: int,
+            cells: Iterable[Tuple[float, float]],
+            progress: Optional[ProgressReporter] = None,
+            se_tolerance: Optional[float] = None,
+            block_size: int = 50,
+            first_replication: int = 0,
+            options: Optional[Dict[str, Any]] = None,
+        ) -> list[dict]
+        Runs Monte Carlo for a given seed and list of (c, rho) cells
     - run_simulation_for_seed(
             seed: int,
             num_replications: int,
@@ -12,6 +31,10 @@ Functions:
             c_range: np.array,
             rho_range: np.array,
             output_dir: str,
+            progress: Optional[ProgressReporter] = None,
+            se_tolerance: Optional[float] = None,
+            block_size: int = 50,
+            options: Optional[Dict[str, Any]] = None,
         ) -> None
         Runs Monte Carlo for a given seed and saves the results
 """
@@ -19,96 +42,298 @@ Functions:
 import numpy as np
 import pandas as pd
 
+from itertools import product
 from pathlib import Path
-from statsmodels.regression.linear_model import OLS
-from statsmodels.stats.multitest import multipletests
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-from data_generation.generate_data import generate_data
+from data_generation.generate_data import generate_arrays
+from simulation.batched_tests import batched_test_decisions
+from utils.execution import kernel_map
+from utils.progress import ProgressReporter
 
+TESTS = ["Wald", "Bonferroni", "Holm-Sidak"]
 
-def run_simulation_for_seed(
+
+def max_rejection_rate_se(cell_results: list[dict]) -> float:
+    """Largest Monte Carlo standard error of the rejection rates in a cell.
+
+    The rejection rate is shrunk as (rejections + 0.5) / (n + 1) before
+    computing the standard error, so that cells with no (or only)
+    rejections do not report a zero standard error after a single block.
+
+    Args:
+        cell_results (list[dict]): results of a single (c, rho) cell.
+
+    Returns:
+        float: largest standard error across the tests in TESTS.
+    """
+    if not cell_results:
+        return np.inf
+    decisions = pd.DataFrame(cell_results, columns=TESTS).to_numpy(dtype=float)
+    n = decisions.shape[0]
+    rates = (decisions.sum(axis=0) + 0.5) / (n + 1)
+    return float(np.sqrt(rates * (1 - rates) / n).max())
+
+
+def _statsmodels_decisions(
+    outcomes: np.ndarray,
+    covariates: np.ndarray,
+    r_matrix: np.ndarray,
+    cov_type: str,
+) -> Dict[str, np.ndarray]:
+    """Test decisions for a batch of samples, fitting each with statsmodels.
+
+    Reference implementation of batched_test_decisions.
+    """
+    from statsmodels.regression.linear_model import OLS
+    from statsmodels.stats.multitest import multipletests
+
+    decisions = {test: np.zeros(len(outcomes), dtype=bool) for test in TESTS}
+    for index, (y, x) in enumerate(zip(outcomes, covariates)):
+        lin_reg_fit = OLS(y, x).fit(cov_type=cov_type)
+
+        # Perform Wald test
+        wald_test = lin_reg_fit.wald_test(r_matrix, use_f=False, scalar=True)
+        decisions["Wald"][index] = wald_test.pvalue <= 0.05
+
+        # Use multiple t-tests
+        p_vals_t = lin_reg_fit.pvalues[r_matrix.argmax(axis=1)]
+        for test, method in [("Bonferroni", "bonferroni"), ("Holm-Sidak", "hs")]:
+            decisions[test][index] = multipletests(p_vals_t, method=method)[0].any()
+    return decisions
+
+
+def _decisions_by_sample(
+    test_decisions: Callable[..., Dict[str, np.ndarray]],
+    outcomes: np.ndarray,
+    covariates: np.ndarray,
+    replications: range,
+    seed: int,
+    **kwargs,
+) -> Tuple[Dict[str, np.ndarray], List[int]]:
+    """Test decisions for a batch of samples, testing one sample at a time.
+
+    Fallback for blocks whose batched tests fail: samples whose test raises
+    are reported and dropped, as fits failing in the reference engine.
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], List[int]]: decisions of the samples
+            that could be tested, and their replications.
+    """
+    decisions = {test: [] for test in TESTS}
+    tested = []
+    for index, replication in enumerate(replications):
+        try:
+            sample_decisions = test_decisions(
+                outcomes[index:index + 1], covariates[index:index + 1], **kwargs
+            )
+        except Exception as e:
+            print(
+                f"Error during fit (seed={seed}, replication={replication}): {e}"
+            )
+            continue
+        for test in TESTS:
+            decisions[test].append(bool(sample_decisions[test][0]))
+        tested.append(replication)
+    decisions = {
+        test: np.array(values, dtype=bool) for test, values in decisions.items()
+    }
+    return decisions, tested
+
+
+def run_simulation_for_cells(
     seed: int,
     num_replications: int,
     num_observations: int,
-    c_range: np.array,
-    rho_range: np.array,
-    output_dir: str,
-):
-    """Runs Monte Carlo simulations for a specific seed and saves as CSV.
+    cells: Iterable[Tuple[float, float]],
+    progress: Optional[ProgressReporter] = None,
+    se_tolerance: Optional[float] = None,
+    block_size: int = 50,
+    first_replication: int = 0,
+    options: Optional[Dict[str, Any]] = None,
+) -> list[dict]:
+    """Runs Monte Carlo simulations for a specific seed and set of cells.
+
+    Replications run in blocks of block_size, which are tested together by
+    batched_test_decisions. If se_tolerance is given, each cell stops once
+    the Monte Carlo standard error of every rejection rate is below
+    se_tolerance, or once num_replications (the hard cap) is reached. The
+    number of replications used is then recorded in the `num_replications`
+    column.
 
     Args:
         seed (int): random seed for reproducibility.
-        num_replications (int): number of replications per seed.
+        num_replications (int): number of replications per seed (maximal
+            number in sequential mode).
         num_observations (int): number of observations in each sample
-        c_range (np.array): range of values for coefficients on covariates
-        rho_range (np.array): range of correlations between covariates
-        output_dir (str): directory to save the output CSV.
+        cells (Iterable[Tuple[float, float]]): (c, rho) pairs to simulate.
+        progress (ProgressReporter, optional): reporter for live progress
+            tracking. Defaults to None (no reporting).
+        se_tolerance (float, optional): target standard error for sequential
+            stopping. Defaults to None (fixed number of replications).
+        block_size (int): number of replications tested together and
+            between stopping checks.
+        first_replication (int): index of the first replication, so that
+            blocks of replications can run as separate tasks. Defaults to 0.
+        options (Dict[str, Any], optional): variant of the DGP and tests,
+            with keys "errors", "t_df" and "heteroskedasticity" (see
+            generate_arrays), "cov_type" (one of COV_TYPES) and "engine"
+            ("batched" or "statsmodels", the slower reference). Missing
+            keys take the defaults of the post. If given, the options are
+            recorded in the results.
+
+    Returns:
+        list[dict]: one record with test decisions per cell and replication.
     """
+    options = {} if options is None else dict(options)
+    error_options = {
+        key: options[key]
+        for key in ("errors", "t_df", "heteroskedasticity")
+        if key in options
+    }
+    cov_type = options.get("cov_type", "nonrobust")
+    if options.get("engine", "batched") == "batched":
+        test_decisions = batched_test_decisions
+    else:
+        test_decisions = _statsmodels_decisions
+
+    if progress is None:
+        progress = ProgressReporter(None, seed)
+
+    WALD_R_MATRIX = np.array([[0, 1, 0], [0, 0, 1]])
     results = []
-    for c in c_range:
-        # Update coefficient vector
+    for c, rho in cells:
+        # Update coefficient vector and covariance matrix of covariates
         betas = np.array([1, c, c])
-        for rho in rho_range:
-            # Update covariance matrix of covariates
-            x_covar = np.array([[0, 0, 0], [0, 1, rho], [0, rho, 1]])
-
-            # Run simulation
-            for replication in range(num_replications):
-                # Generate data
-                data = generate_data(
+        x_covar = np.array([[0, 0, 0], [0, 1, rho], [0, rho, 1]])
+        progress.start_cell(f"c={c:.3f}, rho={rho:.2f}")
+        cell_results = []
+        num_used = 0
+
+        # Run simulation in blocks of replications
+        last_replication = first_replication + num_replications
+        for block_start in range(first_replication, last_replication, block_size):
+            replications = range(
+                block_start, min(block_start + block_size, last_replication)
+            )
+
+            # Generate data
+            samples = [
+                generate_arrays(
                     num_observations,
                     betas,
                     np.array([1, 0, 0]),
                     x_covar,
                     1,
                     seed + replication,
+                    **error_options,
+                )
+                for replication in replications
+            ]
+            outcomes = np.stack([y for y, _ in samples])
+            covariates = np.stack([x for _, x in samples])
+
+            # Perform tests, one sample at a time if the batch fails
+            try:
+                decisions = kernel_map(
+                    test_decisions,
+                    outcomes,
+                    covariates,
+                    r_matrix=WALD_R_MATRIX,
+                    cov_type=cov_type,
+                )
+                tested = list(replications)
+            except Exception as e:
+                print(
+                    f"Error during batched fit (seed={seed}): {e}; "
+                    "testing the block sample by sample"
                 )
+                decisions, tested = _decisions_by_sample(
+                    test_decisions,
+                    outcomes,
+                    covariates,
+                    replications,
+                    seed,
+                    r_matrix=WALD_R_MATRIX,
+                    cov_type=cov_type,
+                )
+
+            # Collect results
+            for index, replication in enumerate(tested):
+                cell_results.append(
+                    {
+                        "seed": seed,
+                        "replication": replication,
+                        "c": c,
+                        "rho": rho,
+                        **{
+                            test: bool(decisions[test][index])
+                            for test in TESTS
+                        },
+                        **options,
+                    }
+                )
+            progress.advance(len(replications))
+            num_used = replications.stop - first_replication
+
+            # Sequential stopping: check precision after every block
+            if (
+                se_tolerance is not None
+                and max_rejection_rate_se(cell_results) <= se_tolerance
+            ):
+                break
+
+        if se_tolerance is not None:
+            for row in cell_results:
+                row["num_replications"] = num_used
+            progress.skip(num_replications - num_used)
+        results.extend(cell_results)
+        progress.finish_cell()
+    return results
+
+
+def run_simulation_for_seed(
+    seed: int,
+    num_replications: int,
+    num_observations: int,
+    c_range: np.array,
+    rho_range: np.array,
+    output_dir: str,
+    progress: Optional[ProgressReporter] = None,
+    se_tolerance: Optional[float] = None,
+    block_size: int = 50,
+    options: Optional[Dict[str, Any]] = None,
+):
+    """Runs Monte Carlo simulations for a specific seed and saves as CSV.
+
+    Args:
+        seed (int): random seed for reproducibility.
+        num_replications (int): number of replications per seed (maximal
+            number in sequential mode, see run_simulation_for_cells).
+        num_observations (int): number of observations in each sample
+        c_range (np.array): range of values for coefficients on covariates
+        rho_range (np.array): range of correlations between covariates
+        output_dir (str): directory to save the output CSV.
+        progress (ProgressReporter, optional): reporter for live progress
+            tracking. Defaults to None (no reporting).
+        se_tolerance (float, optional): target standard error for sequential
+            stopping. Defaults to None (fixed number of replications).
+        block_size (int): number of replications tested together and
+            between stopping checks.
+        options (Dict[str, Any], optional): variant of the DGP and tests,
+            see run_simulation_for_cells.
+    """
+    results = run_simulation_for_cells(
+        seed,
+        num_replications,
+        num_observations,
+        product(c_range, rho_range),
+        progress,
+        se_tolerance,
+        block_size,
+        options=options,
+    )
 
-                # Perform tests
-                try:
-                    # Fit models
-                    lin_reg = OLS(data.iloc[:, 0], data.iloc[:, 1:])
-                    lin_reg_fit = lin_reg.fit()
-
-                    # Perform Wald test
-                    WALD_R_MATRIX = np.array([[0, 1, 0], [0, 0, 1]])
-                    wald_test = lin_reg_fit.wald_test(
-                        WALD_R_MATRIX,
-                        use_f=False,
-                        scalar=True,
-                    )
-                    decision_wald = wald_test.pvalue <= 0.05
-
-                    # Use multiple t-tests
-                    p_vals_t = lin_reg_fit.pvalues.iloc[1:]
-                    t_test_corrected_bonf = multipletests(
-                        p_vals_t,
-                        method="bonferroni",  # Bonferroni
-                    )
-                    t_test_corrected_hs = multipletests(
-                        p_vals_t,
-                        method="hs",  # Holm-Sidak
-                    )
-                    decision_bonf = t_test_corrected_bonf[0].sum() > 0
-                    decision_hs = t_test_corrected_hs[0].sum() > 0
-
-                    # Collect results
-                    results.append(
-                        {
-                            "seed": seed,
-                            "replication": replication,
-                            "c": c,
-                            "rho": rho,
-                            "Wald": decision_wald,
-                            "Bonferroni": decision_bonf,
-                            "Holm-Sidak": decision_hs,
-                        }
-                    )
-
-                except Exception as e:
-                    print(
-                        f"Error during fit (seed={seed}): {e}"
-                    )
     # Save results to CSV
     output_file = Path(output_dir) / f"results_seed_{seed}.csv"
     pd.DataFrame(results).to_csv(output_file, index=False)
@@ -0,0 +1,356 @@
+"""
+animation.py
+
+Parallel, cached and streaming rendering of animations from per-frame data
+slices.
+
+Each frame is described by a small CSV slice written in advance (e.g. one
+slice per value of the animated parameter), so workers read only the data of
+their own frame. The slices are only rewritten when the results they are
+cut from (or the slicing code) change. Frames are rendered in parallel to
+PNG files in a cache folder, named by a hash of the slice contents, the
+source of the module of the drawing function (with its module-level styles)
+and of its other dependencies, and the style. Re-rendering after a change
+therefore only redraws the frames whose data or style changed. The animation
+is then encoded frame by frame without holding all frames in memory.
+
+Functions:
+    - cached_frame_slices(slice_fn: Callable, source_file: str,
+            slice_dir: str) -> List[Path]:
+        Writes the frame slices of a results file, unless they are up to date.
+    - frame_cache_key(draw_fn: Callable, frame_file: Path,
+            style: Dict[str, Any],
+            dependencies: Optional[List[Any]] = None) -> str:
+        Hash identifying the rendered image of a frame.
+    - render_frames(draw_fn: Callable, frame_files: List[Path],
+            style: Dict[str, Any], cache_dir: str,
+            executor: Optional[Executor] = None,
+            dependencies: Optional[List[Any]] = None) -> List[Path]:
+        Renders the frames not found in the cache, in parallel.
+    - encode_animation(frame_images: List[Path], output_file: str,
+            frame_duration: float) -> None:
+        Stream-encodes the frames into a GIF or MP4 file.
+
+Classes:
+    - GifStreamWriter: Writes GIF frames to disk as they arrive.
+    - Mp4StreamWriter: Pipes frames to ffmpeg as they arrive.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import subprocess
+
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import GifImagePlugin, Image
+
+# Name of the file recording what the slices of a folder were written from
+SLICE_MANIFEST = "manifest.json"
+
+
+def _source_digest(objects: List[Any]) -> str:
+    """Hash of the source code of modules, classes or functions."""
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+def cached_frame_slices(
+    slice_fn: Callable[[str, str], List[Path]],
+    source_file: str,
+    slice_dir: str,
+) -> List[Path]:
+    """
+    Returns the frame slices of a results file, calling
+    slice_fn(source_file, slice_dir) only if the slices are missing or were
+    written from another version of the file (size or modification time) or
+    by other slicing code (source of slice_fn). Avoids
+    rescanning large results files when only the drawing changed.
+
+    Args:
+        slice_fn (Callable[[str, str], List[Path]]): Function writing the
+            slices of source_file to slice_dir and returning them in order.
+        source_file (str): Results file the slices are cut from.
+        slice_dir (str): Folder of the slices.
+
+    Returns:
+        List[Path]: Slices, in the order returned by slice_fn.
+    """
+    stat = os.stat(source_file)
+    manifest = {
+        "source_file": str(Path(source_file).resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "code": _source_digest([slice_fn]),
+    }
+    manifest_file = Path(slice_dir) / SLICE_MANIFEST
+    if manifest_file.exists():
+        with open(manifest_file) as file:
+            saved = json.load(file)
+        slice_files = [Path(slice_dir) / name for name in saved.pop("slices")]
+        if saved == manifest and all(path.exists() for path in slice_files):
+            print(f"Reusing {len(slice_files)} slices in {slice_dir}")
+            return slice_files
+        manifest_file.unlink()
+
+    slice_files = slice_fn(source_file, slice_dir)
+    with open(manifest_file, "w") as file:
+        json.dump(
+            {**manifest, "slices": [Path(path).name for path in slice_files]},
+            file,
+            indent=1,
+        )
+    return slice_files
+
+
+def frame_cache_key(
+    draw_fn: Callable,
+    frame_file: Path,
+    style: Dict[str, Any],
+    dependencies: Optional[List[Any]] = None,
+) -> str:
+    """
+    Hash identifying the rendered image of a frame.
+
+    Args:
+        draw_fn (Callable): Drawing function; the source code of its module
+            is hashed, so that editing it (or module-level inputs such as
+            colors) invalidates the cache.
+        frame_file (Path): CSV slice with the data of the frame.
+        style (Dict[str, Any]): JSON-serializable style shared by all frames.
+        dependencies (List[Any], optional): Other modules or functions used
+            by draw_fn whose source is hashed as well.
+
+    Returns:
+        str: Hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(
+        _source_digest([inspect.getmodule(draw_fn), *(dependencies or [])]).encode()
+    )
+    digest.update(json.dumps(style, sort_keys=True).encode())
+    digest.update(Path(frame_file).read_bytes())
+    return digest.hexdigest()[:32]
+
+
+def _render_frame(
+    draw_fn: Callable,
+    frame_file: Path,
+    style: Dict[str, Any],
+    image_file: Path,
+) -> None:
+    """Draws a frame from its slice and saves it atomically as PNG."""
+    import pandas as pd
+
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=style["figsize"], dpi=style["dpi"])
+    draw_fn(figure, pd.read_csv(frame_file), style)
+    tmp_file = image_file.with_name(f".{image_file.stem}.{os.getpid()}.png")
+    figure.savefig(tmp_file, dpi=style["dpi"])
+    os.replace(tmp_file, image_file)
+
+
+def render_frames(
+    draw_fn: Callable,
+    frame_files: List[Path],
+    style: Dict[str, Any],
+    cache_dir: str,
+    executor: Optional[Executor] = None,
+    dependencies: Optional[List[Any]] = None,
+) -> List[Path]:
+    """
+    Renders the frames that are not in the cache yet.
+
+    Args:
+        draw_fn (Callable): Module-level function drawing a frame, called as
+            draw_fn(figure, frame_data, style).
+        frame_files (List[Path]): CSV slices, one per frame, in order.
+        style (Dict[str, Any]): JSON-serializable style shared by all frames.
+            Must contain "figsize" and "dpi".
+        cache_dir (str): Folder of the rendered images.
+        executor (Executor, optional): Executor to render in parallel.
+            Defaults to None (render in the current process).
+        dependencies (List[Any], optional): Modules or functions used by
+            draw_fn outside its module, see frame_cache_key.
+
+    Returns:
+        List[Path]: Rendered images, in the order of frame_files.
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    image_files = [
+        cache_dir / f"{frame_cache_key(draw_fn, frame_file, style, dependencies)}.png"
+        for frame_file in frame_files
+    ]
+    missing = [
+        (frame_file, image_file)
+        for frame_file, image_file in zip(frame_files, image_files)
+        if not image_file.exists()
+    ]
+    if executor is None:
+        for frame_file, image_file in missing:
+            _render_frame(draw_fn, frame_file, style, image_file)
+    else:
+        futures = [
+            executor.submit(_render_frame, draw_fn, frame_file, style, image_file)
+            for frame_file, image_file in missing
+        ]
+        for future in futures:
+            future.result()
+    print(
+        f"Rendered {len(missing)} of {len(frame_files)} frames "
+        f"({len(frame_files) - len(missing)} from cache)"
+    )
+    return image_files
+
+
+class GifStreamWriter:
+    """
+    Writes an animated GIF frame by frame. Every frame gets its own adaptive
+    palette, and only the current frame is held in memory.
+
+    Attributes:
+        output_file (Path): Path of the GIF.
+        frame_duration (float): Seconds per frame.
+        loop (int): Number of loops, 0 for infinite looping.
+    """
+
+    def __init__(
+        self,
+        output_file: str,
+        frame_duration: float,
+        loop: int = 0,
+    ) -> None:
+        self.output_file = Path(output_file)
+        self.frame_duration = frame_duration
+        self.loop = loop
+        self._file = open(self.output_file, "wb")
+        self._header_written = False
+
+    def write(self, image: Image.Image) -> None:
+        """Appends a frame to the GIF."""
+        frame = image.convert("RGB").quantize(256)
+        if not self._header_written:
+            header, _ = GifImagePlugin.getheader(frame, info={"loop": self.loop})
+            self._file.write(b"".join(header))
+            self._header_written = True
+        for chunk in GifImagePlugin.getdata(
+            frame,
+            duration=int(1000 * self.frame_duration),
+            include_color_table=True,
+        ):
+            self._file.write(chunk)
+
+    def close(self) -> None:
+        """Writes the GIF trailer and closes the file."""
+        self._file.write(b";")
+        self._file.close()
+
+    def __enter__(self) -> "GifStreamWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class Mp4StreamWriter:
+    """
+    Writes an H.264 MP4 video frame by frame by piping raw frames to ffmpeg.
+
+    Attributes:
+        output_file (Path): Path of the video.
+        frame_duration (float): Seconds per frame.
+    """
+
+    def __init__(self, output_file: str, frame_duration: float) -> None:
+        """
+        Args:
+            output_file (str): Path of the video.
+            frame_duration (float): Seconds per frame.
+
+        Raises:
+            RuntimeError: If ffmpeg is not installed.
+        """
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("Encoding MP4 requires ffmpeg on the PATH")
+        self.output_file = Path(output_file)
+        self.frame_duration = frame_duration
+        self._process = None
+
+    def write(self, image: Image.Image) -> None:
+        """Appends a frame to the video."""
+        frame = image.convert("RGB")
+        if self._process is None:
+            self._size = frame.size
+            self._process = subprocess.Popen(
+                [
+                    "ffmpeg", "-y", "-loglevel", "error",
+                    "-f", "rawvideo", "-pix_fmt", "rgb24",
+                    "-s", f"{frame.size[0]}x{frame.size[1]}",
+                    "-r", f"{1 / self.frame_duration}",
+                    "-i", "-",
+                    "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                    "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                    str(self.output_file),
+                ],
+                stdin=subprocess.PIPE,
+            )
+        if frame.size != self._size:
+            frame = frame.resize(self._size)
+        self._process.stdin.write(frame.tobytes())
+
+    def close(self) -> None:
+        """Finishes encoding.
+
+        Raises:
+            RuntimeError: If ffmpeg fails.
+        """
+        if self._process is None:
+            return
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {self.output_file}")
+
+    def __enter__(self) -> "Mp4StreamWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def encode_animation(
+    frame_images: List[Path],
+    output_file: str,
+    frame_duration: float,
+) -> None:
+    """
+    Stream-encodes rendered frames into an animation. The format is chosen
+    by the suffix of output_file (.gif or .mp4).
+
+    Args:
+        frame_images (List[Path]): Rendered frames, in order.
+        output_file (str): Path of the animation.
+        frame_duration (float): Seconds per frame.
+
+    Raises:
+        ValueError: If the suffix is neither .gif nor .mp4.
+    """
+    suffix = Path(output_file).suffix.lower()
+    if suffix == ".gif":
+        writer = GifStreamWriter(output_file, frame_duration)
+    elif suffix == ".mp4":
+        writer = Mp4StreamWriter(output_file, frame_duration)
+    else:
+        raise ValueError(f"Unsupported animation format: {suffix}")
+    with writer:
+        for image_file in frame_images:
+            with Image.open(image_file) as image:
+                writer.write(image)
+    print(f"Animation saved to {output_file}")
@@ -0,0 +1,329 @@
+"""
+execution.py
+
+Splits the machine between worker processes and threads per process.
+
+A process pool with one worker per core oversubscribes the machine when every
+worker also starts a BLAS/OpenMP (or numba) thread pool with one thread per
+core: the threads compete for the cores and every worker slows down. This
+module decides how many processes and how many threads per process to run,
+and pins the thread pools of every worker to its share of the cores:
+
+- plan_split() chooses processes x threads for a number of tasks, so that
+  their product does not exceed the available cores.
+- pin_threads() runs in every worker (as initializer of the pool, see
+  `utils.worker_pool.create_executor`). It sets the thread-limit
+  environment variables for libraries loaded later and limits the thread
+  pools of libraries already loaded, through threadpoolctl if installed and
+  numba.set_num_threads.
+- Instead of BLAS threads, the threads of a process can run GIL-releasing
+  batched kernels (stacked numpy operations) on a thread pool with
+  kernel_map(); BLAS is then pinned to a single thread.
+- tune_split() measures the throughput of a workload for several splits and
+  returns the best; save_split() and load_split() keep the result for later
+  runs.
+
+Functions:
+    - available_cores() -> int:
+        Number of cores this process may run on.
+    - thread_limit_environment(num_threads: int) -> Dict[str, str]:
+        Environment variables limiting the thread pools of numeric libraries.
+    - pin_threads(num_threads: int, kernel_threads: bool = False) -> None:
+        Limits the thread pools of the current process.
+    - plan_split(num_processes: Optional[int] = None,
+            threads_per_process: Optional[int] = None,
+            num_tasks: Optional[int] = None) -> Tuple[int, int]:
+        Number of processes and threads per process.
+    - kernel_map(kernel: Callable[..., Dict[str, np.ndarray]],
+            *arrays: np.ndarray, **kwargs) -> Dict[str, np.ndarray]:
+        Applies a batched kernel to chunks of arrays on the kernel threads.
+    - candidate_splits() -> List[Tuple[int, int]]:
+        Splits of the available cores into equal parts.
+    - tune_split(workload: Callable, tasks: List[tuple],
+            candidates: Optional[List[Tuple[int, int]]] = None,
+            kernel_threads: bool = False,
+            preload: Optional[List[str]] = None,
+            warmup_task: Optional[tuple] = None)
+            -> Tuple[Tuple[int, int], Dict[Tuple[int, int], float]]:
+        Measures the throughput of a workload for several splits.
+    - save_split(path: str, split: Tuple[int, int],
+            kernel_threads: bool = False) -> None:
+        Saves a tuned split.
+    - load_split(path: str) -> Optional[Tuple[int, int, bool]]:
+        Loads a tuned split, if any.
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Variables read by OpenMP, OpenBLAS, MKL, Accelerate, numexpr and numba when
+# they start their thread pools
+THREAD_LIMIT_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+]
+
+# Threads of the kernel pool of this process, set by pin_threads
+_KERNEL_THREADS = 1
+_KERNEL_POOL = None
+
+
+def available_cores() -> int:
+    """Number of cores this process may run on (respects CPU affinity)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def thread_limit_environment(num_threads: int) -> Dict[str, str]:
+    """
+    Environment variables that limit the thread pools of numeric libraries
+    started afterwards to num_threads threads.
+    """
+    return {variable: str(num_threads) for variable in THREAD_LIMIT_VARIABLES}
+
+
+def pin_threads(num_threads: int, kernel_threads: bool = False) -> None:
+    """
+    Limits the thread pools of the current process, e.g. a pool worker.
+
+    Args:
+        num_threads (int): Threads of this process.
+        kernel_threads (bool): If True, the threads run batched kernels with
+            kernel_map and BLAS/OpenMP use a single thread. Otherwise BLAS,
+            OpenMP and numba use num_threads threads.
+    """
+    global _KERNEL_THREADS, _KERNEL_POOL
+    library_threads = 1 if kernel_threads else num_threads
+    _KERNEL_THREADS = num_threads if kernel_threads else 1
+    if _KERNEL_POOL is not None:
+        _KERNEL_POOL.shutdown()
+        _KERNEL_POOL = None
+
+    # Libraries loaded later read the environment; libraries preloaded in
+    # the forkserver are limited at runtime
+    os.environ.update(thread_limit_environment(library_threads))
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        threadpool_limits(library_threads)
+    numba = sys.modules.get("numba")
+    if numba is not None:
+        numba.set_num_threads(
+            max(1, min(library_threads, numba.config.NUMBA_NUM_THREADS))
+        )
+
+
+def plan_split(
+    num_processes: Optional[int] = None,
+    threads_per_process: Optional[int] = None,
+    num_tasks: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Number of processes and threads per process. Values that are not given
+    are chosen so that processes x threads fits the available cores: one
+    process per core if there are at least as many tasks as cores, and the
+    spare cores spread over the threads of the processes otherwise.
+
+    Args:
+        num_processes (int, optional): Number of processes.
+        threads_per_process (int, optional): Threads per process.
+        num_tasks (int, optional): Number of tasks that run in parallel at
+            most, e.g. the number of seeds.
+
+    Returns:
+        Tuple[int, int]: Number of processes and threads per process.
+    """
+    cores = available_cores()
+    if num_processes is None:
+        if threads_per_process is None:
+            num_processes = cores if num_tasks is None else min(cores, num_tasks)
+        else:
+            num_processes = max(1, cores // threads_per_process)
+            if num_tasks is not None:
+                num_processes = min(num_processes, num_tasks)
+    if threads_per_process is None:
+        threads_per_process = max(1, cores // num_processes)
+    return max(1, num_processes), max(1, threads_per_process)
+
+
+def kernel_map(
+    kernel: Callable[..., Dict[str, "np.ndarray"]],
+    *arrays: "np.ndarray",
+    **kwargs,
+) -> Dict[str, "np.ndarray"]:
+    """
+    Applies a batched kernel to chunks of arrays (split along the first
+    axis) on the kernel threads of this process and concatenates the
+    results. The kernel must release the GIL (e.g. stacked numpy operations)
+    and treat the rows of the batch independently. Runs the kernel on the
+    whole batch if the process has a single kernel thread.
+
+    Args:
+        kernel (Callable[..., Dict[str, np.ndarray]]): Batched kernel,
+            returning a dictionary of arrays with one row per batch row.
+        *arrays (np.ndarray): Batched arguments of the kernel.
+        **kwargs: Other arguments of the kernel, shared by all chunks.
+
+    Returns:
+        Dict[str, np.ndarray]: Results of the kernel for the whole batch.
+    """
+    global _KERNEL_POOL
+    num_chunks = min(_KERNEL_THREADS, len(arrays[0]))
+    if num_chunks <= 1:
+        return kernel(*arrays, **kwargs)
+    import numpy as np
+
+    if _KERNEL_POOL is None:
+        _KERNEL_POOL = ThreadPoolExecutor(_KERNEL_THREADS)
+    bounds = np.linspace(0, len(arrays[0]), num_chunks + 1).astype(int)
+    futures = [
+        _KERNEL_POOL.submit(
+            kernel, *(array[start:stop] for array in arrays), **kwargs
+        )
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+    chunks = [future.result() for future in futures]
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+
+def candidate_splits() -> List[Tuple[int, int]]:
+    """Splits of the available cores into processes x threads."""
+    cores = available_cores()
+    return [
+        (num_processes, cores // num_processes)
+        for num_processes in range(1, cores + 1)
+        if num_processes in (1, cores) or cores % num_processes == 0
+    ]
+
+
+def _warm_up(workload: Callable, task: tuple, barrier) -> None:
+    """
+    Runs a task of the workload in a worker, then waits for the other
+    workers, so that every worker runs exactly one warm-up task.
+    """
+    workload(*task)
+    barrier.wait()
+
+
+def tune_split(
+    workload: Callable,
+    tasks: List[tuple],
+    candidates: Optional[List[Tuple[int, int]]] = None,
+    kernel_threads: bool = False,
+    preload: Optional[List[str]] = None,
+    warmup_task: Optional[tuple] = None,
+) -> Tuple[Tuple[int, int], Dict[Tuple[int, int], float]]:
+    """
+    Runs the same tasks with every candidate split and measures the time.
+
+    Before timing, every worker of a candidate runs the workload once (e.g.
+    a small task), so that one-off costs such as imports and JIT compilation
+    are not timed and only the work itself is compared.
+
+    Args:
+        workload (Callable): Function run for every task.
+        tasks (List[tuple]): Arguments of the tasks; should be
+            representative of the full run and at least as many as the
+            largest number of processes.
+        candidates (List[Tuple[int, int]], optional): (processes, threads)
+            splits to try. Defaults to the splits of the available cores
+            into equal parts.
+        kernel_threads (bool): Whether the threads run batched kernels, see
+            pin_threads.
+        preload (List[str], optional): Modules to import in the forkserver,
+            see `utils.worker_pool.create_executor`.
+        warmup_task (tuple, optional): Arguments of the warm-up task run by
+            every worker. Defaults to the first task.
+
+    Returns:
+        Tuple[Tuple[int, int], Dict[Tuple[int, int], float]]: Fastest split
+            and seconds taken by every candidate.
+    """
+    from utils.worker_pool import create_executor
+
+    warmup_task = tasks[0] if warmup_task is None else warmup_task
+    timings = {}
+    for num_processes, threads_per_process in candidates or candidate_splits():
+        with multiprocessing.Manager() as manager, create_executor(
+            num_processes, preload, threads_per_process, kernel_threads
+        ) as executor:
+            barrier = manager.Barrier(num_processes)
+            list(executor.map(
+                _warm_up,
+                [workload] * num_processes,
+                [warmup_task] * num_processes,
+                [barrier] * num_processes,
+            ))
+            start = time.perf_counter()
+            futures = [executor.submit(workload, *task) for task in tasks]
+            for future in futures:
+                future.result()
+            timings[(num_processes, threads_per_process)] = (
+                time.perf_counter() - start
+            )
+        print(
+            f"{num_processes} processes x {threads_per_process} threads: "
+            f"{timings[(num_processes, threads_per_process)]:.2f} s"
+        )
+    return min(timings, key=timings.get), timings
+
+
+def save_split(path: str, split: Tuple[int, int], kernel_threads: bool = False) -> None:
+    """
+    Saves a tuned split as JSON.
+
+    Args:
+        path (str): Output file.
+        split (Tuple[int, int]): Number of processes and threads per process.
+        kernel_threads (bool): Whether the threads run batched kernels.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "processes": split[0],
+                "threads_per_process": split[1],
+                "kernel_threads": kernel_threads,
+                "cores": available_cores(),
+            },
+            file,
+            indent=1,
+        )
+
+
+def load_split(path: str) -> Optional[Tuple[int, int, bool]]:
+    """
+    Loads a split saved by save_split. Splits tuned on a machine with a
+    different number of cores are ignored.
+
+    Args:
+        path (str): File written by save_split.
+
+    Returns:
+        Optional[Tuple[int, int, bool]]: Number of processes, threads per
+            process and whether the threads run batched kernels, or None.
+    """
+    if not Path(path).exists():
+        return None
+    with open(path) as file:
+        saved = json.load(file)
+    if saved["cores"] != available_cores():
+        return None
+    return saved["processes"], saved["threads_per_process"], saved["kernel_threads"]
@@ -0,0 +1,196 @@
+"""
+power_animation.py
+
+Renders the animated power curves of the post: for every value of rho, the
+rejection rates of the tests in TESTS as functions of c.
+
+The combined results have one row per seed, cell and replication, which is
+far too large to load at once for the full grid. write_frame_slices reads
+them in chunks and saves one small CSV slice of rejection rates per rho;
+the slices are rewritten only when the combined results change. The frames
+are then rendered in parallel from these slices and cached, and the
+animation is stream-encoded (see utils.animation).
+
+Run from the project folder after the simulations with
+    python -m visualization.power_animation [--output FILE] [--workers N]
+Frames are cached in ANIMATION_DIR.
+The output may be a .gif or an .mp4 file (the latter requires ffmpeg).
+
+Functions:
+    - write_frame_slices(combined_file: str, slice_dir: str,
+            chunksize: int = 1_000_000) -> List[Path]:
+        Aggregates the combined results into one slice of rejection rates
+        per rho.
+    - draw_power_frame(figure: Figure, frame_data: pd.DataFrame,
+            style: Dict[str, Any]) -> None:
+        Draws the power curves of a single rho.
+    - render_power_animation(output_file: str, results_dir: str,
+            animation_dir: str, frame_duration: float,
+            max_workers: Optional[int] = None) -> None:
+        Slices the results, renders the frames and encodes the animation.
+"""
+
+import argparse
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import pandas as pd
+
+from data_generation.parameters import (
+    ANIMATION_DIR,
+    ANIMATION_FRAME_DURATION,
+    OUTPUT_DIR,
+)
+from simulation.run_simulation import TESTS
+from utils.animation import cached_frame_slices, encode_animation, render_frames
+from utils.worker_pool import create_executor
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+# Modules imported once in the forkserver of the rendering workers
+RENDER_PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+    "utils.animation",
+]
+
+TEST_COLORS = {"Wald": "#1f77b4", "Bonferroni": "#d62728", "Holm-Sidak": "#2ca02c"}
+
+
+def write_frame_slices(
+    combined_file: str,
+    slice_dir: str,
+    chunksize: int = 1_000_000,
+) -> List[Path]:
+    """Aggregates the combined results into one slice per rho.
+
+    Reads the results in chunks, so that memory use is bounded by the
+    chunk size and the number of (c, rho) cells. Slices of a previous run
+    that no longer correspond to a rho are removed.
+
+    Args:
+        combined_file (str): combined simulation results.
+        slice_dir (str): folder of the slices.
+        chunksize (int): number of rows read at once.
+
+    Returns:
+        List[Path]: slices with columns c and TESTS (rejection rates),
+            ordered by rho.
+    """
+    sums = []
+    for chunk in pd.read_csv(
+        combined_file, usecols=["c", "rho", *TESTS], chunksize=chunksize
+    ):
+        grouped = chunk.groupby(["rho", "c"])[TESTS]
+        sums.append(grouped.sum().join(grouped.size().rename("count")))
+    totals = pd.concat(sums).groupby(level=["rho", "c"]).sum()
+    power = totals[TESTS].div(totals["count"], axis=0)
+
+    slice_dir = Path(slice_dir)
+    slice_dir.mkdir(parents=True, exist_ok=True)
+    slice_files = []
+    for rho, rho_power in power.groupby(level="rho"):
+        slice_file = slice_dir / f"rho_{rho:+.4f}.csv"
+        rho_power.droplevel("rho").reset_index().assign(rho=rho).to_csv(
+            slice_file, index=False
+        )
+        slice_files.append(slice_file)
+    for stale_file in set(slice_dir.glob("rho_*.csv")) - set(slice_files):
+        stale_file.unlink()
+    return slice_files
+
+
+def draw_power_frame(
+    figure: "Figure",
+    frame_data: pd.DataFrame,
+    style: Dict[str, Any],
+) -> None:
+    """Draws the power curves of a single rho.
+
+    Args:
+        figure (Figure): matplotlib figure to draw on.
+        frame_data (pd.DataFrame): slice written by write_frame_slices.
+        style (Dict[str, Any]): shared style, with the axis limits "xlim".
+    """
+    ax = figure.subplots()
+    for test in TESTS:
+        ax.plot(
+            frame_data["c"],
+            frame_data[test],
+            label=test,
+            color=TEST_COLORS[test],
+            linewidth=2,
+        )
+    ax.axhline(0.05, color="gray", linestyle=":", linewidth=1)
+    ax.set_xlim(style["xlim"])
+    ax.set_ylim(0, 1.02)
+    ax.set_xlabel("$c$")
+    ax.set_ylabel("Power")
+    ax.set_title(rf"$\rho$ = {frame_data['rho'].iloc[0]:.2f}")
+    ax.legend(loc="lower right")
+    ax.grid(alpha=0.3)
+    figure.tight_layout()
+
+
+def render_power_animation(
+    output_file: str,
+    results_dir: str = OUTPUT_DIR,
+    animation_dir: str = ANIMATION_DIR,
+    frame_duration: float = ANIMATION_FRAME_DURATION,
+    max_workers: Optional[int] = None,
+) -> None:
+    """Slices the results, renders the frames in parallel and encodes them.
+
+    Args:
+        output_file (str): path of the .gif or .mp4 animation.
+        results_dir (str): folder with combined_results.csv.
+        animation_dir (str): folder of the slices and the frame cache.
+        frame_duration (float): seconds per frame.
+        max_workers (int, optional): number of rendering processes.
+            Defaults to the number of CPUs.
+    """
+    slice_files = cached_frame_slices(
+        write_frame_slices,
+        Path(results_dir) / "combined_results.csv",
+        Path(animation_dir) / "slices",
+    )
+    c_values = pd.concat(pd.read_csv(file, usecols=["c"])["c"] for file in slice_files)
+    style = {
+        "figsize": [8, 4.5],
+        "dpi": 100,
+        "xlim": [float(c_values.min()), float(c_values.max())],
+    }
+    with create_executor(max_workers, RENDER_PRELOAD_MODULES) as executor:
+        frame_images = render_frames(
+            draw_power_frame,
+            slice_files,
+            style,
+            Path(animation_dir) / "frames",
+            executor,
+        )
+    encode_animation(frame_images, output_file, frame_duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Animated power curves.")
+    parser.add_argument(
+        "--output", default=str(Path(OUTPUT_DIR) / "power_animated.gif")
+    )
+    parser.add_argument("--results-dir", default=OUTPUT_DIR)
+    parser.add_argument("--animation-dir", default=ANIMATION_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--frame-duration", type=float, default=ANIMATION_FRAME_DURATION
+    )
+    args = parser.parse_args()
+    render_power_animation(
+        args.output,
+        args.results_dir,
+        args.animation_dir,
+        frame_duration=args.frame_duration,
+        max_workers=args.workers,
+    )